@@ -0,0 +1,144 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+try:
+    from script.metrics import Histogram
+    from script.request_tracing import record_stage
+except ImportError:
+    from metrics import Histogram
+    from request_tracing import record_stage
+
+
+# Predictions running at once; 0 disables admission control.
+MAX_IN_FLIGHT = int(os.getenv("IPC_MAX_IN_FLIGHT", "64"))
+# Requests allowed to wait for a slot; beyond this they are rejected with 429.
+ADMISSION_QUEUE_SIZE = int(os.getenv("IPC_ADMISSION_QUEUE_SIZE", "128"))
+# Longest a queued request waits for a slot before it is rejected with 503.
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("IPC_ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+
+QUEUE_WAIT_BUCKETS_SECONDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Overloaded(Exception):
+    """A request was shed; ``status_code`` and ``retry_after`` describe the response."""
+
+    def __init__(self, reason: str, status_code: int, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds concurrent predictions with a FIFO wait queue in front of them.
+
+    Up to ``max_in_flight`` requests hold a slot at once. Others wait in order,
+    at most ``max_queue`` of them and for at most ``max_queue_seconds``. A full
+    queue rejects immediately (429); a request that waits too long is rejected
+    with 503. Both carry a Retry-After estimate derived from recent service
+    times, so shed requests never reach the embedding or Gemini calls.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queue: int = ADMISSION_QUEUE_SIZE,
+        max_queue_seconds: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queue = max(0, max_queue)
+        self.max_queue_seconds = max_queue_seconds
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._service_seconds = 1.0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_queue_timeout = 0
+        self.queue_wait = Histogram(QUEUE_WAIT_BUCKETS_SECONDS)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, at least one."""
+        slots = max(1, self.max_in_flight)
+        return max(1, math.ceil(self._service_seconds * (len(self._waiters) + 1) / slots))
+
+    async def acquire(self) -> None:
+        if not self.enabled:
+            return
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            self.queue_wait.observe(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded("queue_full", 429, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started_at = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.max_queue_seconds)
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as this request gave up; pass it on.
+                self.release()
+            else:
+                # release() may already have popped (and skipped) the cancelled waiter.
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(exc, TimeoutError):
+                self.rejected_queue_timeout += 1
+                raise Overloaded("queue_timeout", 503, self.retry_after()) from None
+            raise
+        self.admitted += 1
+        waited = time.monotonic() - started_at
+        self.queue_wait.observe(waited)
+        record_stage("admission_queue", waited)
+
+    def release(self) -> None:
+        if not self.enabled:
+            return
+        # The slot moves straight to the oldest waiter, so in_flight stays put.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def observe_service_time(self, seconds: float) -> None:
+        self._service_seconds += 0.2 * (seconds - self._service_seconds)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe_service_time(time.monotonic() - started_at)
+            self.release()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_queue_timeout": self.rejected_queue_timeout,
+            "service_seconds_ewma": round(self._service_seconds, 4),
+            "queue_wait": self.queue_wait.snapshot(),
+        }
@@ -0,0 +1 @@
+"""Offline benchmarks: local OpenRouter/Gemini stand-ins and per-stage micro-benchmarks."""
@@ -0,0 +1,404 @@
+"""
+Offline micro-benchmarks for each stage of the IPC pipeline.
+
+Starts the local OpenRouter/Gemini stand-ins (stub_upstreams.py), points the
+pipeline at them with dummy API keys, builds an in-memory NumPy index from
+the stub embeddings of all 522 sections, and times:
+
+    embedding        one embeddings request through UpstreamHTTP
+    vector_query     exact search over the NumPy index
+    rank_rows        distances -> catalog rows with similarities
+    gate_and_prompt  similarity gate, candidate selection and prompt build
+    llm              one Gemini generateContent request
+    validation       parsing and guarding the Gemini answer
+    predict          end-to-end synchronous prediction
+    predict_async    end-to-end async predictions, --concurrency at a time
+
+Result, semantic and embedding caches are disabled so every iteration does
+the full work. Results are written as JSON (default results/<time>_<commit>.json)
+together with the commit, the stub settings and the host; with --baseline the
+run is compared against an earlier file and the exit status is 1 when any
+benchmark regressed by more than --threshold.
+
+Usage (from the repository root):
+    python -m script.benchmarks.run_benchmarks [--iterations 200] [--baseline results/<file>.json]
+    python -m script.benchmarks.run_benchmarks --compare OLD.json NEW.json
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable
+
+import numpy as np
+
+try:
+    from script.benchmarks.stub_upstreams import UpstreamStubs, add_stub_arguments, deterministic_embedding
+    from script.benchmarks.stub_upstreams import gemini_answer, stubs_from_args
+    from script.build_embedding_texts import build_embedding_texts
+    from script.section_catalog import get_section_catalog
+except ImportError:
+    from benchmarks.stub_upstreams import UpstreamStubs, add_stub_arguments, deterministic_embedding
+    from benchmarks.stub_upstreams import gemini_answer, stubs_from_args
+    from build_embedding_texts import build_embedding_texts
+    from section_catalog import get_section_catalog
+
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+BENCHMARKS = (
+    "embedding",
+    "vector_query",
+    "rank_rows",
+    "gate_and_prompt",
+    "llm",
+    "validation",
+    "predict",
+    "predict_async",
+)
+# Benchmarks this fast are noisy in relative terms; smaller absolute changes are never regressions.
+MIN_REGRESSION_DELTA_MS = float(os.getenv("IPC_BENCH_MIN_DELTA_MS", "0.05"))
+COMPARED_LATENCIES = ("p50_ms", "p95_ms")
+# Every Nth section summary becomes a benchmark incident.
+CASE_STRIDE = 8
+
+_PIPELINE_MODULES = ("retrieve_sections", "ipc_reasoning_engine")
+
+
+def _configure_environment(stubs: UpstreamStubs) -> None:
+    """Point the pipeline at the stubs; must run before the pipeline modules are imported."""
+    loaded = [name for name in _PIPELINE_MODULES if name in sys.modules or f"script.{name}" in sys.modules]
+    if loaded:
+        raise RuntimeError(f"{', '.join(loaded)} already imported; the stub URLs would not take effect")
+    os.environ.update(stubs.env())
+    os.environ.setdefault("OPENROUTER_API_KEY", "offline-benchmark")
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    for name in ("IPC_RESULT_CACHE_SIZE", "IPC_SEMANTIC_CACHE_SIZE", "IPC_EMBEDDING_CACHE_SIZE"):
+        os.environ[name] = "0"
+    os.environ["IPC_EMBEDDING_CACHE_PATH"] = ""
+
+
+def _import(name: str) -> Any:
+    try:
+        return importlib.import_module(f"script.{name}")
+    except ImportError:
+        return importlib.import_module(name)
+
+
+def _load_pipeline() -> SimpleNamespace:
+    return SimpleNamespace(
+        retrieval=_import("retrieve_sections"),
+        engine=_import("ipc_reasoning_engine"),
+        candidates=_import("candidate_selection"),
+        upstream=_import("upstream_http"),
+    )
+
+
+def _build_index(directory: Path, dimensions: int) -> Path:
+    """Write a NumPy index of the stub embeddings of every section, as export_numpy_index would."""
+    texts = build_embedding_texts()
+    matrix = np.asarray(
+        [deterministic_embedding(item["embedding_text"], dimensions) for item in texts],
+        dtype=np.float32,
+    )
+    matrix_path = directory / "benchmark_index.npy"
+    np.save(matrix_path, matrix)
+    with matrix_path.with_suffix(".meta.json").open("w", encoding="utf-8") as file:
+        json.dump({"ids": [item["id"] for item in texts], "space": "l2"}, file)
+    return matrix_path
+
+
+def _benchmark_cases() -> list[str]:
+    records = get_section_catalog().ordered[::CASE_STRIDE]
+    return [record.summary for record in records if record.summary.strip()]
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    # Nearest-rank percentile on an already sorted list.
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(durations: list[float], errors: int = 0, wall_seconds: float | None = None) -> dict[str, Any]:
+    """Latency summary in milliseconds for one benchmark."""
+    ordered = sorted(duration * 1000 for duration in durations)
+    if not ordered:
+        return {"iterations": 0, "errors": errors}
+    wall_seconds = wall_seconds if wall_seconds is not None else sum(durations)
+    return {
+        "iterations": len(ordered),
+        "errors": errors,
+        "mean_ms": round(statistics.fmean(ordered), 4),
+        "stdev_ms": round(statistics.pstdev(ordered), 4),
+        "min_ms": round(ordered[0], 4),
+        "p50_ms": round(_percentile(ordered, 0.50), 4),
+        "p90_ms": round(_percentile(ordered, 0.90), 4),
+        "p95_ms": round(_percentile(ordered, 0.95), 4),
+        "p99_ms": round(_percentile(ordered, 0.99), 4),
+        "max_ms": round(ordered[-1], 4),
+        "ops_per_second": round(len(ordered) / wall_seconds, 2) if wall_seconds > 0 else None,
+    }
+
+
+def _time_calls(function: Callable[[int], Any], iterations: int, warmup: int) -> dict[str, Any]:
+    for i in range(warmup):
+        try:
+            function(i)
+        except Exception:
+            pass
+
+    durations: list[float] = []
+    errors = 0
+    for i in range(iterations):
+        started_at = time.perf_counter()
+        try:
+            function(warmup + i)
+        except Exception:
+            errors += 1
+            continue
+        durations.append(time.perf_counter() - started_at)
+    return summarize(durations, errors)
+
+
+async def _time_concurrent(
+    function: Callable[[int], Awaitable[Any]],
+    iterations: int,
+    warmup: int,
+    concurrency: int,
+) -> dict[str, Any]:
+    slots = asyncio.Semaphore(max(1, concurrency))
+    durations: list[float] = []
+    errors = 0
+
+    async def one(i: int, record: bool) -> None:
+        nonlocal errors
+        async with slots:
+            started_at = time.perf_counter()
+            try:
+                await function(i)
+            except Exception:
+                errors += int(record)
+                return
+            if record:
+                durations.append(time.perf_counter() - started_at)
+
+    await asyncio.gather(*(one(i, False) for i in range(warmup)))
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(warmup + i, True) for i in range(iterations)))
+    return summarize(durations, errors, time.perf_counter() - started_at)
+
+
+def _run_benchmarks(args: argparse.Namespace, pipeline: SimpleNamespace, engine: Any) -> dict[str, dict]:
+    retrieval, reasoning = pipeline.retrieval, pipeline.engine
+    top_k = pipeline.candidates.CANDIDATE_MAX_K
+    cases = _benchmark_cases()
+    index = engine.index()
+
+    # Inputs for the isolated stages are prepared locally, once, so injected
+    # upstream failures only affect the stages that call the stubs.
+    embeddings = [deterministic_embedding(text, args.dimensions) for text in cases]
+    hits = [index.query(embedding, top_k) for embedding in embeddings]
+    ranked = [engine._rank_rows(ids, distances, top_k) for ids, distances in hits]
+    gated = [reasoning._gate_candidates(text, rows) for text, rows in zip(cases, ranked)]
+    prompts = [gate for gate in gated if "llm_prompt" in gate]
+    if not prompts:
+        raise RuntimeError("No benchmark case passed the similarity gate; check IPC_SIMILARITY_THRESHOLD")
+    answers = [gemini_answer(gate["llm_prompt"]) for gate in prompts]
+    decision_paths: dict[str, int] = {}
+
+    def predict(i: int) -> None:
+        _, decision_path = reasoning.predict_ipc_section_with_path(case(i), engine)
+        decision_paths[decision_path] = decision_paths.get(decision_path, 0) + 1
+
+    def case(i: int) -> str:
+        return cases[i % len(cases)]
+
+    stages: dict[str, Callable[[int], Any]] = {
+        "embedding": lambda i: retrieval._request_embedding(case(i)),
+        "vector_query": lambda i: index.query(embeddings[i % len(embeddings)], top_k),
+        "rank_rows": lambda i: engine._rank_rows(*hits[i % len(hits)], top_k),
+        "gate_and_prompt": lambda i: reasoning._gate_candidates(case(i), ranked[i % len(ranked)]),
+        "llm": lambda i: reasoning._request_gemini(prompts[i % len(prompts)]["llm_prompt"]),
+        "validation": lambda i: reasoning._finalize_prediction(prompts[i % len(prompts)], answers[i % len(answers)]),
+        "predict": predict,
+    }
+
+    results: dict[str, dict] = {}
+    for name in args.only or BENCHMARKS:
+        started_at = time.perf_counter()
+        if name == "predict_async":
+            results[name] = asyncio.run(_predict_async(args, pipeline, engine, cases))
+            results[name]["concurrency"] = args.concurrency
+        else:
+            results[name] = _time_calls(stages[name], args.iterations, args.warmup)
+        if name == "predict":
+            # Warm-up included; a shift here (e.g. towards circuit_open) explains odd latencies.
+            results[name]["decision_paths"] = decision_paths
+        print(f"{name:<16} {_format_row(results[name])}  ({time.perf_counter() - started_at:.1f}s)")
+    return results
+
+
+async def _predict_async(args: argparse.Namespace, pipeline: SimpleNamespace, engine: Any, cases: list[str]) -> dict:
+    reasoning = pipeline.engine
+    decision_paths: dict[str, int] = {}
+
+    async def predict(i: int) -> None:
+        _, decision_path = await reasoning.apredict_ipc_section_with_path(cases[i % len(cases)], engine)
+        decision_paths[decision_path] = decision_paths.get(decision_path, 0) + 1
+
+    try:
+        result = await _time_concurrent(predict, args.iterations, args.warmup, args.concurrency)
+        result["decision_paths"] = decision_paths
+        return result
+    finally:
+        # The async clients belong to this event loop, which asyncio.run closes next.
+        await pipeline.upstream.get_upstream_http().aclose()
+
+
+def _format_row(result: dict) -> str:
+    if not result.get("iterations"):
+        return f"no successful iterations ({result.get('errors', 0)} errors)"
+    return (
+        f"p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  "
+        f"{result['ops_per_second'] or 0:>10.1f} ops/s  errors {result['errors']}"
+    )
+
+
+def _git(*command: str) -> str | None:
+    try:
+        completed = subprocess.run(
+            ["git", *command],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+
+def _run_metadata(args: argparse.Namespace, stubs: UpstreamStubs) -> dict[str, Any]:
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git("rev-parse", "HEAD"),
+        "git_dirty": bool(status) if status is not None else None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "stubs": stubs.stats(),
+        },
+    }
+
+
+def compare(
+    baseline: dict,
+    current: dict,
+    threshold: float,
+    min_delta_ms: float = MIN_REGRESSION_DELTA_MS,
+) -> list[str]:
+    """Describe every benchmark that got slower than ``baseline`` by more than ``threshold``."""
+    regressions: list[str] = []
+    for name, result in current.get("benchmarks", {}).items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous.get("iterations") or not result.get("iterations"):
+            continue
+        for metric in COMPARED_LATENCIES:
+            before, after = previous[metric], result[metric]
+            if after > before * (1 + threshold) and after - before > min_delta_ms:
+                regressions.append(f"{name}.{metric}: {before:.3f} -> {after:.3f} ms ({after / before - 1:+.1%})")
+        before, after = previous.get("ops_per_second"), result.get("ops_per_second")
+        if name == "predict_async" and before and after and after < before / (1 + threshold):
+            regressions.append(f"{name}.ops_per_second: {before:.1f} -> {after:.1f} ({after / before - 1:+.1%})")
+        if result.get("errors", 0) > previous.get("errors", 0):
+            regressions.append(f"{name}.errors: {previous.get('errors', 0)} -> {result['errors']}")
+    return regressions
+
+
+def _stub_settings(report: dict) -> Any:
+    return report.get("config", {}).get("stubs", {}).get("upstreams")
+
+
+def _report_comparison(baseline_path: Path, baseline: dict, current: dict, threshold: float) -> int:
+    print(f"\nCompared with {baseline_path} (commit {str(baseline.get('git_commit'))[:12]}):")
+    if _stub_settings(baseline) != _stub_settings(current):
+        print("  note: stub latency/error settings differ from the baseline; upstream-bound stages are not comparable")
+    regressions = compare(baseline, current, threshold)
+    for line in regressions:
+        print(f"  REGRESSION {line}")
+    if not regressions:
+        print(f"  no regressions beyond {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def _load_results(path: Path) -> dict:
+    with path.open("r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the IPC pipeline against local upstream stand-ins.")
+    parser.add_argument("--iterations", type=int, default=200, help="measured calls per benchmark (default 200)")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed calls before measuring (default 20)")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight predictions for predict_async")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument("--output", type=Path, default=None, help="default: results/<time>_<commit>.json")
+    parser.add_argument("--baseline", type=Path, default=None, help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown vs baseline (default 0.10)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("OLD", "NEW"), help="compare two results files")
+    add_stub_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.compare:
+        old_path, new_path = args.compare
+        sys.exit(_report_comparison(old_path, _load_results(old_path), _load_results(new_path), args.threshold))
+
+    with stubs_from_args(args) as stubs, tempfile.TemporaryDirectory(prefix="ipc-bench-") as directory:
+        _configure_environment(stubs)
+        pipeline = _load_pipeline()
+        engine = pipeline.retrieval.RetrievalEngine(
+            backend="numpy",
+            index_path=_build_index(Path(directory), args.dimensions),
+        )
+        engine.open()
+        try:
+            report = _run_metadata(args, stubs)
+            report["benchmarks"] = _run_benchmarks(args, pipeline, engine)
+            report["config"]["stubs"] = stubs.stats()
+        finally:
+            engine.close()
+            pipeline.upstream.get_upstream_http().close()
+
+    output = args.output
+    if output is None:
+        commit = (report["git_commit"] or "nogit")[:12]
+        output = RESULTS_DIR / f"{time.strftime('%Y%m%dT%H%M%S')}_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline is not None:
+        sys.exit(_report_comparison(args.baseline, _load_results(args.baseline), report, args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Local stand-ins for the OpenRouter embeddings and Gemini generateContent APIs.
+
+Both run on one threaded HTTP server bound to 127.0.0.1 and speak just enough
+of each wire format for the pipeline's clients:
+
+    POST /api/v1/embeddings                                  OpenRouter embeddings
+    POST /v1beta/models/<model>:generateContent              Gemini, JSON body
+    POST /v1beta/models/<model>:streamGenerateContent?alt=sse Gemini, SSE chunks
+
+Embeddings are deterministic: a text always maps to the same unit vector
+(hashed bag of words), so related texts land near each other and retrieval
+behaves like it does with real vectors. Gemini answers with valid JSON that
+picks the first allowed section from the prompt.
+
+Each upstream has its own latency distribution and error rate, drawn from a
+seeded RNG so runs are repeatable. Latency specs:
+
+    fixed:0.05            always 50 ms
+    uniform:0.02,0.08     uniform between 20 and 80 ms
+    lognormal:0.05,0.5    median 50 ms, log-space sigma 0.5 (long right tail)
+
+Usage (standalone, e.g. for running the API against it):
+    python -m script.benchmarks.stub_upstreams --port 8900 --llm-latency lognormal:0.4,0.3
+
+then start the API with IPC_OPENROUTER_EMBEDDINGS_URL and IPC_GEMINI_API_BASE
+set to the printed URLs and any non-empty OPENROUTER_API_KEY / GEMINI_API_KEY.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+EMBEDDING_DIMENSIONS = 256
+STREAM_CHUNK_CHARS = 24
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_ALLOWED_SECTIONS = re.compile(r"Allowed Section Numbers:\n(\[.*?\])\n")
+
+
+def deterministic_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    """Unit vector for ``text``; identical texts always get identical vectors."""
+    vector = [0.0] * dimensions
+    for token in _TOKEN.findall(text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        vector[digest % dimensions] += 1.0 if (digest >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0.0:
+        vector[0] = 1.0
+        return vector
+    return [value / norm for value in vector]
+
+
+class LatencyModel:
+    """Samples a delay in seconds from a ``kind:params`` spec (see the module docstring)."""
+
+    def __init__(self, spec: str = "fixed:0") -> None:
+        kind, _, params = spec.partition(":")
+        values = [float(value) for value in params.split(",") if value.strip()] if params else []
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"Invalid latency spec {spec!r}; use fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+        if any(value < 0 for value in values):
+            raise ValueError(f"Latency spec {spec!r} must not be negative")
+        self.spec = spec
+        self.kind = kind
+        self._values = values
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self._values[0]
+        if self.kind == "uniform":
+            return rng.uniform(self._values[0], self._values[1])
+        median, sigma = self._values
+        if median == 0.0:
+            return 0.0
+        return rng.lognormvariate(math.log(median), sigma)
+
+
+class UpstreamBehaviour:
+    """Latency and failure injection for one stubbed upstream."""
+
+    def __init__(self, latency: str = "fixed:0", error_rate: float = 0.0, error_status: int = 503) -> None:
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def describe(self) -> dict[str, Any]:
+        return {"latency": self.latency.spec, "error_rate": self.error_rate, "error_status": self.error_status}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_StubServer"
+
+    def setup(self) -> None:
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle plus the
+        # client's delayed ACK adds ~40 ms to every response.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_HEAD(self) -> None:
+        # Connection warm-up probes the origin; any answer will do.
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        self.do_HEAD()
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+
+        stubs = self.server.stubs
+        if self.path.rstrip("/").endswith("/embeddings"):
+            upstream = "embeddings"
+        elif ":generateContent" in self.path or ":streamGenerateContent" in self.path:
+            upstream = "gemini"
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        failed = stubs.delay(upstream)
+        if failed is not None:
+            self._send_json(failed, {"error": {"code": failed, "message": "injected failure"}})
+            return
+        if upstream == "embeddings":
+            self._embeddings(body)
+        elif ":streamGenerateContent" in self.path:
+            self._stream_gemini(body)
+        else:
+            self._send_json(200, {"candidates": [{"content": {"parts": [{"text": gemini_answer(_prompt(body))}]}}]})
+
+    def _embeddings(self, body: dict) -> None:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = self.server.stubs.dimensions
+        self.server.stubs.count("embedding_inputs", len(inputs))
+        data = [
+            {"object": "embedding", "index": index, "embedding": deterministic_embedding(text, dimensions)}
+            for index, text in enumerate(inputs)
+        ]
+        self._send_json(200, {"object": "list", "data": data, "model": body.get("model")})
+
+    def _stream_gemini(self, body: dict) -> None:
+        text = gemini_answer(_prompt(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            chunk = {"candidates": [{"content": {"parts": [{"text": text[start : start + STREAM_CHUNK_CHARS]}]}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+        self.close_connection = True
+
+
+def _prompt(body: dict) -> str:
+    try:
+        return str(body["contents"][0]["parts"][0]["text"])
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+def gemini_answer(prompt: str) -> str:
+    """The stub's verdict for a reasoning prompt: the first allowed section, as JSON text."""
+    match = _ALLOWED_SECTIONS.search(prompt)
+    allowed = json.loads(match.group(1)) if match else []
+    return json.dumps(
+        {
+            "predicted_sections": allowed[:1],
+            "confidence": 0.85 if allowed else 0.0,
+            "explanation": "Stub verdict: the first allowed candidate section.",
+        }
+    )
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under a concurrent benchmark,
+    # turning into one-second SYN retries on the client.
+    request_queue_size = 256
+    stubs: "UpstreamStubs"
+
+
+class UpstreamStubs:
+    """Runs the OpenRouter and Gemini stand-ins on a background thread.
+
+    Use as a context manager, or call ``start``/``stop``. ``env()`` returns the
+    variables that point the pipeline at the stubs; they must be set before
+    ``retrieve_sections`` and ``ipc_reasoning_engine`` are imported.
+    """
+
+    def __init__(
+        self,
+        embeddings: UpstreamBehaviour | None = None,
+        gemini: UpstreamBehaviour | None = None,
+        dimensions: int = EMBEDDING_DIMENSIONS,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.behaviours = {"embeddings": embeddings or UpstreamBehaviour(), "gemini": gemini or UpstreamBehaviour()}
+        self.dimensions = dimensions
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts: dict[str, int] = {}
+        self._server = _StubServer((host, port), _StubHandler)
+        self._server.stubs = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def embeddings_url(self) -> str:
+        return f"{self.base_url}/api/v1/embeddings"
+
+    @property
+    def gemini_api_base(self) -> str:
+        return f"{self.base_url}/v1beta/"
+
+    def env(self) -> dict[str, str]:
+        return {
+            "IPC_OPENROUTER_EMBEDDINGS_URL": self.embeddings_url,
+            "IPC_GEMINI_API_BASE": self.gemini_api_base,
+        }
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def delay(self, upstream: str) -> int | None:
+        """Sleep for the upstream's sampled latency; returns an error status to send, if any."""
+        behaviour = self.behaviours[upstream]
+        with self._lock:
+            seconds = behaviour.latency.sample(self._rng)
+            failed = behaviour.error_rate > 0 and self._rng.random() < behaviour.error_rate
+            self._counts[f"{upstream}_requests"] = self._counts.get(f"{upstream}_requests", 0) + 1
+            if failed:
+                self._counts[f"{upstream}_errors"] = self._counts.get(f"{upstream}_errors", 0) + 1
+        if seconds > 0:
+            time.sleep(seconds)
+        return behaviour.error_status if failed else None
+
+    def start(self) -> "UpstreamStubs":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="upstream-stubs", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> "UpstreamStubs":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "seed": self.seed,
+            "dimensions": self.dimensions,
+            "upstreams": {name: behaviour.describe() for name, behaviour in self.behaviours.items()},
+            "counts": counts,
+        }
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--embed-latency", default="fixed:0.01", help="embeddings latency spec (default fixed:0.01)")
+    parser.add_argument("--embed-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", default="fixed:0.05", help="Gemini latency spec (default fixed:0.05)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def stubs_from_args(args: argparse.Namespace, port: int = 0) -> UpstreamStubs:
+    return UpstreamStubs(
+        embeddings=UpstreamBehaviour(args.embed_latency, args.embed_error_rate, args.error_status),
+        gemini=UpstreamBehaviour(args.llm_latency, args.llm_error_rate, args.error_status),
+        dimensions=args.dimensions,
+        seed=args.seed,
+        port=port,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve local OpenRouter embeddings and Gemini stand-ins.")
+    parser.add_argument("--port", type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stubs = stubs_from_args(args, args.port)
+    for name, value in stubs.env().items():
+        print(f"{name}={value}", flush=True)
+    try:
+        stubs.start()
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Resumable bulk scoring for JSONL incident archives.
+
+Each input line is a JSON object holding the incident text (``--text-field``,
+default ``text``; ``description`` is accepted as a fallback). Each output line
+carries the input line number, the optional record id, the prediction from
+``predict_ipc_section``, its decision path and the pipeline version.
+
+Results are written in input order as they complete. A checkpoint next to the
+output records how many input lines are fully written and the matching output
+size, so an interrupted run resumes exactly where it stopped. Only a bounded
+window of lines is in flight at once, so memory stays flat for any input size.
+
+A prediction that ends in an upstream failure (upstream_error,
+deadline_exceeded, circuit_open, bulkhead_full) is retried with exponential
+back-off. If it still fails, the run stops before that line: nothing from it
+on is written, the checkpoint points at it, and re-running the same command
+retries it once the upstream has recovered.
+
+Usage:
+    python bulk_score.py incidents.jsonl scored.jsonl --workers 16 --rate 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+try:
+    from script.ipc_reasoning_engine import TRANSIENT_PATHS, pipeline_version, predict_ipc_section_with_path
+    from script.retrieve_sections import get_retrieval_engine
+except ImportError:
+    from ipc_reasoning_engine import TRANSIENT_PATHS, pipeline_version, predict_ipc_section_with_path
+    from retrieve_sections import get_retrieval_engine
+
+
+MIN_TEXT_LENGTH = 10
+
+
+class UpstreamUnavailable(RuntimeError):
+    """A line still failed upstream after its retries; the run stops before it."""
+
+
+class RateLimiter:
+    """Spaces out calls to at most ``rate`` per second; ``rate <= 0`` disables it."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.interval == 0.0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+
+def _non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
+
+
+def _non_negative_float(value: str) -> float:
+    number = float(value)
+    if not number >= 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Score a JSONL file of incidents with the IPC pipeline.")
+    parser.add_argument("input", type=Path)
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--workers", type=_positive_int, default=8, help="concurrent predictions (default 8)")
+    parser.add_argument(
+        "--rate",
+        type=_non_negative_float,
+        default=0.0,
+        help="max predictions started per second (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=_non_negative_int,
+        default=0,
+        help="buffered lines (default 4 x workers)",
+    )
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="default: <output>.ckpt")
+    parser.add_argument("--checkpoint-every", type=_positive_int, default=100, help="lines between checkpoints")
+    parser.add_argument(
+        "--progress-interval",
+        type=_non_negative_float,
+        default=10.0,
+        help="seconds between progress lines",
+    )
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start over")
+    parser.add_argument(
+        "--retries",
+        type=_non_negative_int,
+        default=3,
+        help="retries per line after an upstream failure",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=_non_negative_float,
+        default=5.0,
+        help="seconds before the first retry, doubling each time (default 5)",
+    )
+    return parser.parse_args()
+
+
+def _count_lines(path: Path) -> int:
+    count = 0
+    with path.open("rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            count += block.count(b"\n")
+    return count
+
+
+def _load_checkpoint(path: Path) -> dict[str, Any] | None:
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _save_checkpoint(path: Path, state: dict[str, Any]) -> None:
+    temporary = path.with_name(path.name + ".tmp")
+    with temporary.open("w", encoding="utf-8") as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def _score_line(
+    raw: bytes,
+    line_number: int,
+    args: argparse.Namespace,
+    version: str,
+) -> dict[str, Any]:
+    record: dict[str, Any] = {"line": line_number}
+    try:
+        item = json.loads(raw)
+    except ValueError:
+        record["error"] = "invalid_json"
+        return record
+    if not isinstance(item, dict):
+        record["error"] = "invalid_record"
+        return record
+
+    record["id"] = item.get(args.id_field)
+    text = str(item.get(args.text_field) or item.get("description") or "").strip()
+    if len(text) < MIN_TEXT_LENGTH:
+        record["error"] = "insufficient_input"
+        return record
+
+    # Upstream failures come back as fallback answers, not exceptions; they
+    # must not be archived as if the incident had no applicable section.
+    for attempt in range(max(0, args.retries) + 1):
+        result, decision_path = predict_ipc_section_with_path(text)
+        if decision_path not in TRANSIENT_PATHS:
+            break
+        if attempt < args.retries:
+            time.sleep(args.retry_backoff * 2**attempt)
+    else:
+        record.update({"error": decision_path, "decision_path": decision_path})
+        return record
+
+    record.update({"result": result, "decision_path": decision_path, "pipeline_version": version})
+    return record
+
+
+def _completed(record: dict[str, Any]) -> Future:
+    future: Future = Future()
+    future.set_result(record)
+    return future
+
+
+def _format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def main() -> None:
+    args = _parse_args()
+    checkpoint_path = args.checkpoint or args.output.with_name(args.output.name + ".ckpt")
+    max_in_flight = args.max_in_flight or 4 * max(1, args.workers)
+    version = pipeline_version()
+
+    state = None if args.restart else _load_checkpoint(checkpoint_path)
+    if state is not None and state.get("pipeline_version") != version:
+        raise SystemExit(
+            f"Checkpoint was written by pipeline {state.get('pipeline_version')}, current is {version}; "
+            "rerun with --restart to rescore from the beginning."
+        )
+
+    start_line = state["line"] if state else 0
+    if state:
+        output = args.output.open("r+b")
+        output.truncate(state["output_bytes"])
+        output.seek(0, os.SEEK_END)
+    else:
+        output = args.output.open("wb")
+
+    total = _count_lines(args.input)
+    get_retrieval_engine().open()
+    limiter = RateLimiter(args.rate)
+    print(f"Scoring {args.input} from line {start_line} of {total} (pipeline {version})", file=sys.stderr)
+
+    window: deque[tuple[int, Future]] = deque()
+    next_line = start_line
+    started_at = time.monotonic()
+    last_progress = started_at
+    errors = 0
+
+    def _write_oldest() -> None:
+        nonlocal next_line, errors
+        line_number, future = window[0]
+        record = future.result()
+        if record.get("decision_path") in TRANSIENT_PATHS:
+            errors += 1
+            raise UpstreamUnavailable(f"line {line_number} ended in {record['decision_path']} after retries")
+        window.popleft()
+        errors += "error" in record
+        output.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        next_line = line_number + 1
+
+    def _checkpoint() -> None:
+        output.flush()
+        os.fsync(output.fileno())
+        _save_checkpoint(
+            checkpoint_path,
+            {
+                "input": str(args.input),
+                "line": next_line,
+                "output_bytes": output.tell(),
+                "pipeline_version": version,
+                "updated_at": time.time(),
+            },
+        )
+
+    def _progress(force: bool = False) -> None:
+        nonlocal last_progress
+        now = time.monotonic()
+        if not force and now - last_progress < args.progress_interval:
+            return
+        last_progress = now
+        done = next_line - start_line
+        rate = done / (now - started_at) if now > started_at else 0.0
+        remaining = max(0, total - next_line)
+        eta = _format_eta(remaining / rate) if rate > 0 else "--:--:--"
+        print(
+            f"{next_line}/{total} lines  {rate:.1f} lines/s  errors={errors}  ETA {eta}",
+            file=sys.stderr,
+        )
+
+    stopped: UpstreamUnavailable | None = None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool, args.input.open("rb") as source:
+            try:
+                try:
+                    for line_number, raw in enumerate(source):
+                        if line_number < start_line:
+                            continue
+                        if not raw.strip():
+                            window.append((line_number, _completed({"line": line_number, "error": "empty_line"})))
+                        else:
+                            limiter.acquire()
+                            window.append((line_number, pool.submit(_score_line, raw, line_number, args, version)))
+
+                        while len(window) >= max_in_flight or (window and window[0][1].done()):
+                            _write_oldest()
+                            if next_line % args.checkpoint_every == 0:
+                                _checkpoint()
+                        _progress()
+                except KeyboardInterrupt:
+                    print("Interrupted; finishing in-flight lines before checkpointing.", file=sys.stderr)
+                    for _, future in window:
+                        future.cancel()
+
+                while window and not window[0][1].cancelled():
+                    _write_oldest()
+            except UpstreamUnavailable as exc:
+                stopped = exc
+                print(f"Stopping: {exc}; waiting for in-flight lines.", file=sys.stderr)
+                for _, future in window:
+                    future.cancel()
+    finally:
+        _checkpoint()
+        output.close()
+        _progress(force=True)
+
+    print(f"Checkpoint: {checkpoint_path}", file=sys.stderr)
+    if stopped is not None:
+        raise SystemExit(
+            f"Upstream unavailable: {stopped}. Lines from {next_line} on were not written; "
+            "re-run the same command to resume there."
+        )
+
+
+if __name__ == "__main__":
+    main()
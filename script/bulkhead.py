@@ -0,0 +1,97 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+try:
+    from script.metrics import Histogram
+    from script.request_tracing import record_stage
+except ImportError:
+    from metrics import Histogram
+    from request_tracing import record_stage
+
+
+WAIT_BUCKETS_SECONDS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class BulkheadFull(RuntimeError):
+    """A pipeline stage has no free slot and its wait queue is full."""
+
+
+class Bulkhead:
+    """Concurrency limit plus a bounded wait queue for one pipeline stage.
+
+    Each stage (embedding, vector query, Gemini) gets its own bulkhead, so a
+    stage that slows down only queues its own callers: once ``max_queue`` are
+    waiting, further callers fail fast with ``BulkheadFull`` instead of piling
+    up. Blocking work submitted with ``run_in_thread`` runs on the bulkhead's
+    own threads rather than the event loop's shared default executor.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int) -> None:
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._executor: ThreadPoolExecutor | None = None
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time = Histogram(WAIT_BUCKETS_SECONDS)
+        self.run_time = Histogram()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise BulkheadFull(f"{self.name} stage is saturated")
+
+        must_wait = self._semaphore.locked()
+        queued_at = time.monotonic()
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        started_at = time.monotonic()
+        self.wait_time.observe(started_at - queued_at)
+        if must_wait:
+            record_stage(f"{self.name}_queue", started_at - queued_at)
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self.run_time.observe(time.monotonic() - started_at)
+            self._semaphore.release()
+
+    async def run_in_thread(self, function: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix=self.name)
+        # Like asyncio.to_thread, carry the caller's context (and its deadline) along.
+        call = functools.partial(contextvars.copy_context().run, function, *args)
+        async with self.slot():
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_time": self.wait_time.snapshot(),
+            "run_time": self.run_time.snapshot(),
+        }
@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+try:
+    from script.metrics import Histogram
+except ImportError:
+    from metrics import Histogram
+
+
+def normalize_query_text(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip()
+
+
+class LRUTTLCache:
+    """Bounded, thread-safe LRU map whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None) -> None:
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class EmbeddingCache:
+    """Query-embedding cache with an in-memory LRU tier and an optional SQLite tier.
+
+    Keys are derived from the normalized query text and the embedding model, so a
+    model change never serves stale vectors. The async methods keep SQLite off the
+    event loop: disk reads run in a worker thread and disk writes are queued to a
+    single background writer.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float | None = None,
+        disk_path: str | None = None,
+    ) -> None:
+        self._memory = LRUTTLCache(max_entries, ttl_seconds)
+        self._ttl_seconds = self._memory.ttl_seconds
+        self._disk: sqlite3.Connection | None = None
+        self._disk_lock = threading.Lock()
+        self._writer: ThreadPoolExecutor | None = None
+        self.disk_hits = 0
+        self.disk_write_errors = 0
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        payload = f"{model}\x00{normalize_query_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _open_disk(self, disk_path: str) -> None:
+        Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(disk_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        if self._ttl_seconds is not None:
+            connection.execute(
+                "DELETE FROM embeddings WHERE created_at < ?",
+                (time.time() - self._ttl_seconds,),
+            )
+        connection.commit()
+        self._disk = connection
+
+    def _disk_get(self, key: str) -> tuple[float, ...] | None:
+        return self._disk_get_many([key])[0]
+
+    def _disk_get_many(self, keys: list[str]) -> list[tuple[float, ...] | None]:
+        if self._disk is None:
+            return [None] * len(keys)
+        with self._disk_lock:
+            if self._disk is None:
+                return [None] * len(keys)
+            rows = [
+                self._disk.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+                for key in keys
+            ]
+        vectors: list[tuple[float, ...] | None] = []
+        for row in rows:
+            if row is None or (self._ttl_seconds is not None and time.time() - row[1] > self._ttl_seconds):
+                vectors.append(None)
+                continue
+            vector = array("d")
+            vector.frombytes(row[0])
+            vectors.append(tuple(vector))
+        return vectors
+
+    def _disk_put(self, key: str, model: str, vector: tuple[float, ...]) -> None:
+        self._disk_put_many([(key, model, vector)])
+
+    def _disk_put_many(self, entries: list[tuple[str, str, tuple[float, ...]]]) -> None:
+        if self._disk is None:
+            return
+        now = time.time()
+        rows = [(key, model, array("d", vector).tobytes(), now) for key, model, vector in entries]
+        with self._disk_lock:
+            if self._disk is None:
+                return
+            self._disk.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._disk.commit()
+
+    def _write_behind(self, entries: list[tuple[str, str, tuple[float, ...]]]) -> None:
+        try:
+            self._disk_put_many(entries)
+        except sqlite3.Error:
+            # The memory tier already holds these; a lost disk write only costs a future re-embed.
+            self.disk_write_errors += 1
+
+    def _remember(self, keys: list[str], vectors: list[tuple[float, ...] | None]) -> None:
+        for key, vector in zip(keys, vectors):
+            if vector is not None:
+                self.disk_hits += 1
+                self._memory.put(key, vector)
+
+    def get(self, text: str, model: str) -> list[float] | None:
+        key = self.make_key(text, model)
+        vector = self._memory.get(key)
+        if vector is None:
+            vector = self._disk_get(key)
+            if vector is None:
+                return None
+            self._remember([key], [vector])
+        return list(vector)
+
+    async def aget_many(self, texts: list[str], model: str) -> list[list[float] | None]:
+        """Like ``get`` for several texts; memory misses share one disk lookup in a worker thread."""
+        keys = [self.make_key(text, model) for text in texts]
+        vectors = [self._memory.get(key) for key in keys]
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        if missing and self._disk is not None:
+            found = await asyncio.to_thread(self._disk_get_many, [keys[position] for position in missing])
+            self._remember([keys[position] for position in missing], found)
+            for position, vector in zip(missing, found):
+                vectors[position] = vector
+        return [list(vector) if vector is not None else None for vector in vectors]
+
+    async def aget(self, text: str, model: str) -> list[float] | None:
+        return (await self.aget_many([text], model))[0]
+
+    def put(self, text: str, model: str, embedding: list[float]) -> None:
+        key = self.make_key(text, model)
+        vector = tuple(float(value) for value in embedding)
+        self._memory.put(key, vector)
+        self._disk_put(key, model, vector)
+
+    def put_behind(self, items: list[tuple[str, list[float]]], model: str) -> None:
+        """Store ``(text, embedding)`` pairs in memory now and queue the disk write; never blocks."""
+        entries = [
+            (self.make_key(text, model), model, tuple(float(value) for value in embedding))
+            for text, embedding in items
+        ]
+        for key, _, vector in entries:
+            self._memory.put(key, vector)
+        if self._disk is None or not entries:
+            return
+        with self._disk_lock:
+            if self._writer is None:
+                # One writer keeps commits ordered and off the callers' threads.
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+            writer = self._writer
+        writer.submit(self._write_behind, entries)
+
+    def close(self) -> None:
+        # Flush queued writes before the connection goes away.
+        with self._disk_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+        with self._disk_lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def stats(self) -> dict[str, Any]:
+        memory = self._memory.stats()
+        return {
+            "memory_size": memory["size"],
+            "max_entries": memory["max_entries"],
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": memory["misses"] - self.disk_hits,
+            "evictions": memory["evictions"],
+            "expirations": memory["expirations"],
+            "disk_enabled": self._disk is not None,
+            "disk_write_errors": self.disk_write_errors,
+        }
+
+
+SIMILARITY_BUCKETS = (0.5, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.96, 0.97, 0.98, 0.99, 0.995, 1.0)
+
+
+class SemanticCache:
+    """Reuses verdicts for near-duplicate queries.
+
+    Recently answered query embeddings are kept, unit-normalized, in a fixed-size
+    ring buffer. A lookup is an exact cosine scan over that buffer; an entry only
+    matches when its similarity clears ``threshold`` and it was answered for the
+    same candidate set, so the reused verdict is always one the guard allowed.
+    """
+
+    def __init__(self, max_entries: int, threshold: float) -> None:
+        self.max_entries = max(0, int(max_entries))
+        self.threshold = float(threshold)
+        self._matrix: np.ndarray | None = None
+        self._entries: list[tuple[frozenset[str], Any] | None] = [None] * self.max_entries
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.best_similarity = Histogram(SIMILARITY_BUCKETS)
+
+    @staticmethod
+    def _unit(embedding: list[float]) -> np.ndarray | None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    def get(self, embedding: list[float], candidate_sections: list[str]) -> Any:
+        if self.max_entries == 0:
+            return None
+        query = self._unit(embedding)
+        if query is None:
+            return None
+
+        candidate_key = frozenset(candidate_sections)
+        with self._lock:
+            if self._size == 0 or self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._matrix[:self._size] @ query
+            self.best_similarity.observe(min(float(similarities.max()), 1.0))
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.threshold:
+                    break
+                entry = self._entries[position]
+                if entry is not None and entry[0] == candidate_key:
+                    self.hits += 1
+                    return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, embedding: list[float], candidate_sections: list[str], value: Any) -> None:
+        if self.max_entries == 0:
+            return
+        vector = self._unit(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries = [None] * self.max_entries
+                self._next = 0
+                self._size = 0
+            self._matrix[self._next] = vector
+            self._entries[self._next] = (frozenset(candidate_sections), value)
+            self._next = (self._next + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._matrix = None
+            self._entries = [None] * self.max_entries
+            self._next = 0
+            self._size = 0
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "best_similarity": self.best_similarity.snapshot(),
+        }
@@ -0,0 +1,134 @@
+"""
+Offline calibration for the retrieval-only fast path.
+
+Runs every labeled case through retrieval and the full Gemini path, then sweeps
+(top-1 similarity, top-1/top-2 margin) thresholds. For each pair it reports
+coverage (share of requests that would skip the LLM), agreement with the LLM
+verdict on those requests, and end-to-end accuracy against the labels.
+
+Usage:
+    python calibrate_fast_path.py [labeled.jsonl]
+
+The labeled file holds one {"description": ..., "expected_section": ...} object
+per line; validate_retrieval.TEST_CASES is used when no file is given.
+"""
+
+import json
+import os
+import sys
+
+from candidate_selection import CANDIDATE_MAX_K
+from ipc_reasoning_engine import _finalize_prediction, _gate_candidates, _request_gemini, fast_path_eligible
+from retrieve_sections import _retrieve_with_scores_batch
+from validate_retrieval import TEST_CASES
+
+
+TARGET_AGREEMENT = float(os.getenv("IPC_FAST_PATH_TARGET_AGREEMENT", "0.95"))
+
+
+def _load_cases(path: str | None) -> list[dict]:
+    if path is None:
+        return TEST_CASES
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _observe(cases: list[dict]) -> list[dict]:
+    texts = [case["description"] for case in cases]
+    ranked_batch = _retrieve_with_scores_batch(texts, top_k=CANDIDATE_MAX_K)
+
+    observations: list[dict] = []
+    for case, text, ranked in zip(cases, texts, ranked_batch):
+        if not ranked:
+            continue
+        gate_result = _gate_candidates(text, ranked)
+        llm_section = None
+        if "llm_prompt" in gate_result:
+            try:
+                result = _finalize_prediction(gate_result, _request_gemini(gate_result["llm_prompt"]))
+            except Exception as exc:
+                print(f"[SKIP] {text[:60]!r}: {type(exc).__name__}: {exc}")
+                continue
+            if result.get("predicted_sections"):
+                llm_section = str(result["predicted_sections"][0])
+
+        observations.append(
+            {
+                "ranked": ranked,
+                "fast_section": str(ranked[0][0].get("section_number", "")),
+                "llm_section": llm_section,
+                "expected": str(case.get("expected_section", "")),
+            }
+        )
+    return observations
+
+
+def _evaluate(observations: list[dict], min_similarity: float, min_margin: float) -> dict:
+    routed = 0
+    agreed = 0
+    correct = 0
+    for item in observations:
+        if fast_path_eligible(item["ranked"], min_similarity, min_margin):
+            routed += 1
+            agreed += item["fast_section"] == item["llm_section"]
+            correct += item["fast_section"] == item["expected"]
+        else:
+            correct += item["llm_section"] == item["expected"]
+
+    total = len(observations)
+    return {
+        "min_similarity": min_similarity,
+        "min_margin": min_margin,
+        "coverage": routed / total if total else 0.0,
+        "agreement": agreed / routed if routed else 1.0,
+        "accuracy": correct / total if total else 0.0,
+    }
+
+
+def main() -> None:
+    cases = _load_cases(sys.argv[1] if len(sys.argv) > 1 else None)
+    observations = _observe(cases)
+    if not observations:
+        raise SystemExit("No cases could be evaluated.")
+
+    tops = sorted({round(float(item["ranked"][0][1]), 4) for item in observations})
+    margins = sorted(
+        {
+            round(float(item["ranked"][0][1]) - float(item["ranked"][1][1]), 4)
+            for item in observations
+            if len(item["ranked"]) > 1
+        }
+        | {0.0}
+    )
+
+    llm_only = _evaluate(observations, float("inf"), float("inf"))
+    results = [_evaluate(observations, top, margin) for top in tops for margin in margins]
+    eligible = [row for row in results if row["coverage"] > 0 and row["agreement"] >= TARGET_AGREEMENT]
+    eligible.sort(key=lambda row: (-row["coverage"], -row["accuracy"], -row["min_similarity"], -row["min_margin"]))
+
+    print("=" * 60)
+    print("FAST PATH CALIBRATION")
+    print(f"cases={len(observations)} target_agreement={TARGET_AGREEMENT:.2f}")
+    print(f"LLM-only accuracy: {llm_only['accuracy']:.2f}")
+    print("=" * 60)
+    print(f"{'min_sim':>8} {'margin':>8} {'coverage':>9} {'agreement':>10} {'accuracy':>9}")
+    for row in eligible[:10]:
+        print(
+            f"{row['min_similarity']:>8.4f} {row['min_margin']:>8.4f} {row['coverage']:>9.2f} "
+            f"{row['agreement']:>10.2f} {row['accuracy']:>9.2f}"
+        )
+    print()
+
+    if not eligible:
+        print("No threshold pair reaches the target agreement; keep the fast path disabled.")
+        return
+
+    best = eligible[0]
+    print("Recommended settings:")
+    print("  IPC_FAST_PATH_ENABLED=1")
+    print(f"  IPC_FAST_PATH_MIN_SIMILARITY={best['min_similarity']:.4f}")
+    print(f"  IPC_FAST_PATH_MIN_MARGIN={best['min_margin']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
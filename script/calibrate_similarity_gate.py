@@ -0,0 +1,101 @@
+"""
+Calibration for the similarity gate (SIMILARITY_THRESHOLD).
+
+Embeds an in-domain query set (incident descriptions that should reach the
+LLM) and an out-of-domain set (junk and off-topic text that should not), then
+compares their top-1 cosine similarities and sweeps the threshold. No Gemini
+calls are made.
+
+Usage:
+    python calibrate_similarity_gate.py [in_domain.jsonl] [out_of_domain.jsonl]
+
+Each file holds one {"description": ...} object per line. Defaults are
+validate_retrieval.TEST_CASES and OUT_OF_DOMAIN_QUERIES below.
+"""
+
+import json
+import os
+import statistics
+import sys
+
+from retrieve_sections import _retrieve_with_scores_batch
+from validate_retrieval import TEST_CASES
+
+
+OUT_OF_DOMAIN_QUERIES = [
+    "1234567890 987654321",
+    "asdf qwerty zxcv uiop",
+    "The weather is nice today.",
+    "What is the best recipe for chocolate chip cookies?",
+    "How do I reverse a linked list in Python?",
+    "Recommend a good science fiction novel to read this summer.",
+    "The stock market closed higher after the central bank announcement.",
+    "My favourite football team won the league last night.",
+    "Explain how photosynthesis works in green plants.",
+    "Book a table for two at an Italian restaurant at 8 pm.",
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit.",
+    "hello hello hello hello",
+]
+
+# Share of in-domain queries that must still reach the LLM.
+TARGET_IN_DOMAIN_PASS = float(os.getenv("IPC_GATE_TARGET_IN_DOMAIN_PASS", "1.0"))
+
+
+def _load_descriptions(path: str | None, default: list[str]) -> list[str]:
+    if path is None:
+        return default
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line)["description"] for line in file if line.strip()]
+
+
+def _top_similarities(texts: list[str]) -> list[float]:
+    return [float(ranked[0][1]) for ranked in _retrieve_with_scores_batch(texts, top_k=1) if ranked]
+
+
+def _describe(label: str, values: list[float]) -> None:
+    print(
+        f"{label:<14} n={len(values):<3} min={min(values):.4f} median={statistics.median(values):.4f} "
+        f"max={max(values):.4f}"
+    )
+
+
+def main() -> None:
+    in_domain = _top_similarities(
+        _load_descriptions(sys.argv[1] if len(sys.argv) > 1 else None, [t["description"] for t in TEST_CASES])
+    )
+    out_of_domain = _top_similarities(
+        _load_descriptions(sys.argv[2] if len(sys.argv) > 2 else None, OUT_OF_DOMAIN_QUERIES)
+    )
+    if not in_domain or not out_of_domain:
+        raise SystemExit("Both query sets must be non-empty.")
+
+    print("=" * 60)
+    print("SIMILARITY GATE CALIBRATION (top-1 cosine similarity)")
+    print("=" * 60)
+    _describe("in-domain", in_domain)
+    _describe("out-of-domain", out_of_domain)
+    print()
+
+    print(f"{'threshold':>10} {'in_pass':>8} {'ood_reject':>11}")
+    rows = []
+    for threshold in sorted(set(round(value, 4) for value in in_domain + out_of_domain)):
+        in_pass = sum(value >= threshold for value in in_domain) / len(in_domain)
+        ood_reject = sum(value < threshold for value in out_of_domain) / len(out_of_domain)
+        rows.append((threshold, in_pass, ood_reject))
+        print(f"{threshold:>10.4f} {in_pass:>8.2f} {ood_reject:>11.2f}")
+    print()
+
+    lowest_in, highest_out = min(in_domain), max(out_of_domain)
+    if highest_out < lowest_in:
+        recommended = round((highest_out + lowest_in) / 2.0, 4)
+        print(f"Sets are separable; margin between them is {lowest_in - highest_out:.4f}.")
+    else:
+        eligible = [row for row in rows if row[1] >= TARGET_IN_DOMAIN_PASS]
+        recommended = max(eligible, key=lambda row: (row[2], row[0]))[0] if eligible else lowest_in
+        print(f"Sets overlap; keeping at least {TARGET_IN_DOMAIN_PASS:.0%} of in-domain queries.")
+
+    print(f"Recommended: IPC_SIMILARITY_THRESHOLD={recommended}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Adaptive candidate selection.
+
+Sizes the candidate list handed to the LLM from the shape of the retrieval
+scores instead of always sending TOP_K sections.
+
+Policies:
+    fixed  - the first ``max_k`` candidates.
+    gap    - cut at the largest drop between consecutive scores, if that drop
+             is at least ``gap_ratio`` of the score spread in the window.
+    elbow  - cut at the knee of the score curve: the point furthest below the
+             chord from the first to the last score, if that distance is at
+             least ``elbow_min_distance`` on the normalised curve.
+
+Both adaptive policies keep the whole window when the scores are flat. They
+work on the spread rather than on absolute similarities, so they are not
+affected by how the vector space maps distances to scores.
+
+Run as a script to report recall on validate_retrieval.TEST_CASES per policy.
+"""
+
+import os
+from typing import Any
+
+try:
+    from script.retrieve_sections import TOP_K
+except ImportError:
+    from retrieve_sections import TOP_K
+
+
+POLICY_FIXED = "fixed"
+POLICY_GAP = "gap"
+POLICY_ELBOW = "elbow"
+POLICIES = (POLICY_FIXED, POLICY_GAP, POLICY_ELBOW)
+
+CANDIDATE_POLICY = os.getenv("IPC_CANDIDATE_POLICY", POLICY_GAP)
+CANDIDATE_MIN_K = int(os.getenv("IPC_CANDIDATE_MIN_K", "3"))
+# Retrieval depth; raise it above TOP_K to let flat score distributions widen the set.
+CANDIDATE_MAX_K = int(os.getenv("IPC_CANDIDATE_MAX_K", str(TOP_K)))
+CANDIDATE_GAP_RATIO = float(os.getenv("IPC_CANDIDATE_GAP_RATIO", "0.35"))
+CANDIDATE_ELBOW_MIN_DISTANCE = float(os.getenv("IPC_CANDIDATE_ELBOW_MIN_DISTANCE", "0.25"))
+
+
+def _gap_cut(scores: list[float], min_k: int, gap_ratio: float) -> int:
+    spread = scores[0] - scores[-1]
+    if spread <= 0.0:
+        return len(scores)
+
+    best_cut = len(scores)
+    best_gap = 0.0
+    for cut in range(min_k, len(scores)):
+        gap = scores[cut - 1] - scores[cut]
+        if gap > best_gap:
+            best_cut, best_gap = cut, gap
+
+    return best_cut if best_gap >= gap_ratio * spread else len(scores)
+
+
+def _elbow_cut(scores: list[float], min_k: int, min_distance: float) -> int:
+    spread = scores[0] - scores[-1]
+    last = len(scores) - 1
+    if spread <= 0.0 or last == 0:
+        return len(scores)
+
+    best_cut = len(scores)
+    best_distance = 0.0
+    for position in range(min_k, len(scores)):
+        chord = 1.0 - position / last
+        normalised = (scores[position] - scores[-1]) / spread
+        distance = chord - normalised
+        if distance > best_distance:
+            best_cut, best_distance = position, distance
+
+    return best_cut if best_distance >= min_distance else len(scores)
+
+
+def select_candidates(
+    ranked_candidates: list[tuple[dict[str, Any], float]],
+    policy: str = CANDIDATE_POLICY,
+    min_k: int = CANDIDATE_MIN_K,
+    max_k: int = CANDIDATE_MAX_K,
+    gap_ratio: float = CANDIDATE_GAP_RATIO,
+    elbow_min_distance: float = CANDIDATE_ELBOW_MIN_DISTANCE,
+) -> list[tuple[dict[str, Any], float]]:
+    """Return the leading slice of ``ranked_candidates`` (best first) chosen by ``policy``."""
+    window = ranked_candidates[:max(1, max_k)]
+    min_k = max(1, min(min_k, len(window)))
+    if policy == POLICY_FIXED or len(window) <= min_k:
+        return window
+
+    scores = [float(score) for _, score in window]
+    if policy == POLICY_GAP:
+        return window[:_gap_cut(scores, min_k, gap_ratio)]
+    if policy == POLICY_ELBOW:
+        return window[:_elbow_cut(scores, min_k, elbow_min_distance)]
+    raise ValueError(f"Unknown candidate selection policy: {policy!r}")
+
+
+def _evaluate(policy: str, ranked_batch: list[list[tuple[dict[str, Any], float]]], expected: list[str]) -> dict:
+    hits = 0
+    sizes: list[int] = []
+    for ranked, section in zip(ranked_batch, expected):
+        selected = select_candidates(ranked, policy=policy)
+        sizes.append(len(selected))
+        if section in [str(row[0].get("section_number", "")) for row in selected]:
+            hits += 1
+    return {
+        "policy": policy,
+        "recall": hits / len(expected) if expected else 0.0,
+        "hits": hits,
+        "mean_k": sum(sizes) / len(sizes) if sizes else 0.0,
+        "min_k": min(sizes, default=0),
+        "max_k": max(sizes, default=0),
+    }
+
+
+def main() -> None:
+    try:
+        from script.retrieve_sections import _retrieve_with_scores_batch
+        from script.validate_retrieval import TEST_CASES
+    except ImportError:
+        from retrieve_sections import _retrieve_with_scores_batch
+        from validate_retrieval import TEST_CASES
+
+    depth = max(CANDIDATE_MAX_K, TOP_K)
+    ranked_batch = _retrieve_with_scores_batch([test["description"] for test in TEST_CASES], top_k=depth)
+    expected = [test["expected_section"] for test in TEST_CASES]
+
+    print("=" * 60)
+    print("CANDIDATE SELECTION EVALUATION")
+    print(
+        f"min_k={CANDIDATE_MIN_K} max_k={CANDIDATE_MAX_K} "
+        f"gap_ratio={CANDIDATE_GAP_RATIO} elbow_min_distance={CANDIDATE_ELBOW_MIN_DISTANCE}"
+    )
+    print("=" * 60)
+    for policy in POLICIES:
+        result = _evaluate(policy, ranked_batch, expected)
+        print(
+            f"{result['policy']:<6} recall={result['recall']:.2f} ({result['hits']}/{len(expected)}) "
+            f"mean_k={result['mean_k']:.2f} k_range=[{result['min_k']}, {result['max_k']}]"
+        )
+
+
+if __name__ == "__main__":
+    main()
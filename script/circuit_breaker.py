@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+BREAKER_WINDOW = int(os.getenv("IPC_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("IPC_BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("IPC_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("IPC_BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("IPC_BREAKER_OPEN_SECONDS", "30"))
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream's breaker is open, so the call was not attempted."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one upstream provider.
+
+    The outcome of the last ``window`` calls is kept. Once at least
+    ``min_calls`` are recorded, the breaker opens when the share of failures
+    reaches ``failure_rate`` or the share of calls slower than
+    ``slow_call_seconds`` reaches ``slow_call_rate``. While open every call is
+    rejected with ``CircuitOpenError``. After ``open_seconds`` a single probe
+    call is let through: success closes the breaker, failure or slowness opens
+    it again. Other calls keep failing fast while the probe runs, so a
+    recovering provider is not stampeded.
+
+    Thread-safe, so the sync script path and the event loop can share one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slow_call_seconds: float,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+    ) -> None:
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self._outcomes: deque[tuple[bool, bool]] = deque(maxlen=max(1, window))
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return STATE_HALF_OPEN
+            return self._state
+
+    def _acquire(self) -> bool:
+        """Admit a call or raise ``CircuitOpenError``; returns whether it is the half-open probe."""
+        with self._lock:
+            if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = STATE_HALF_OPEN
+            if self._state == STATE_CLOSED:
+                return False
+            if self._state == STATE_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(f"circuit for {self.name} is open")
+
+    def _trip(self) -> None:
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.trips += 1
+
+    def _record(self, probe: bool, failed: bool, slow: bool) -> None:
+        with self._lock:
+            if probe:
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._trip()
+                else:
+                    self._state = STATE_CLOSED
+                    self._outcomes.clear()
+                return
+            # Calls admitted before the breaker opened finish late; they say
+            # nothing new about the state it is already in.
+            if self._state != STATE_CLOSED:
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(outcome[0] for outcome in self._outcomes)
+            slow_calls = sum(outcome[1] for outcome in self._outcomes)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._trip()
+
+    def _release(self, probe: bool) -> None:
+        if probe:
+            with self._lock:
+                self._probe_in_flight = False
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Wrap one upstream call; raises ``CircuitOpenError`` without running it while open."""
+        probe = self._acquire()
+        started_at = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self._record(probe, failed=True, slow=time.monotonic() - started_at >= self.slow_call_seconds)
+            raise
+        except BaseException:
+            # Cancelled (lost hedge, deadline, client gone): only a call that had
+            # already run past the slow threshold tells us about the upstream.
+            if time.monotonic() - started_at >= self.slow_call_seconds:
+                self._record(probe, failed=True, slow=True)
+            else:
+                self._release(probe)
+            raise
+        self._record(probe, failed=False, slow=time.monotonic() - started_at >= self.slow_call_seconds)
+
+    def stats(self) -> dict[str, Any]:
+        state = self.state
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = sum(outcome[0] for outcome in self._outcomes)
+            slow_calls = sum(outcome[1] for outcome in self._outcomes)
+            return {
+                "state": state,
+                "window_calls": calls,
+                "failure_rate": round(failures / calls, 4) if calls else 0.0,
+                "slow_call_rate": round(slow_calls / calls, 4) if calls else 0.0,
+                "slow_call_seconds": self.slow_call_seconds,
+                "rejected": self.rejected,
+                "trips": self.trips,
+            }
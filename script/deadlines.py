@@ -0,0 +1,77 @@
+import asyncio
+import contextvars
+import inspect
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Iterator
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's end-to-end time budget is spent."""
+
+
+_expires_at: contextvars.ContextVar[float | None] = contextvars.ContextVar("ipc_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float | None) -> Iterator[None]:
+    """Bound the enclosed work to ``seconds`` from now.
+
+    The deadline lives in a context variable, so it follows the request into
+    awaited coroutines, tasks and ``asyncio.to_thread`` calls. A nested scope can
+    only tighten an outer one. ``None`` or ``0`` leaves the current deadline as is.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+
+    expires_at = time.monotonic() + seconds
+    current = _expires_at.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _expires_at.set(expires_at)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current deadline, or ``None`` when there is none."""
+    expires_at = _expires_at.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def remaining_timeout() -> float | None:
+    """Timeout for the next upstream call: the remaining budget, or ``None`` for the client default."""
+    left = remaining()
+    if left is None:
+        return None
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return left
+
+
+async def within_deadline(awaitable: Awaitable[Any]) -> Any:
+    """Await ``awaitable``, cancelling it when the current deadline passes."""
+    try:
+        timeout = remaining_timeout()
+    except DeadlineExceeded:
+        if inspect.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except TimeoutError:
+        if expired():
+            raise DeadlineExceeded("request deadline exceeded") from None
+        raise
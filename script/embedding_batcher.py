@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+try:
+    from script.metrics import SIZE_BUCKETS, Histogram
+except ImportError:
+    from metrics import SIZE_BUCKETS, Histogram
+
+
+WAIT_BUCKETS_SECONDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+
+
+class EmbeddingMicroBatcher:
+    """Collects concurrent query texts and embeds them with one multi-input request.
+
+    A batch is dispatched when ``max_batch`` texts are waiting or ``max_wait_ms``
+    has passed since the first one arrived, whichever comes first. Each caller
+    awaits its own future, so a failed request fails exactly the callers in it.
+    """
+
+    def __init__(
+        self,
+        request_embeddings: Callable[[list[str]], Awaitable[list[list[float]]]],
+        max_batch: int,
+        max_wait_ms: float,
+    ) -> None:
+        self._request_embeddings = request_embeddings
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._pending: list[tuple[str, float, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.batch_size = Histogram(SIZE_BUCKETS)
+        self.wait_time = Histogram(WAIT_BUCKETS_SECONDS)
+
+    async def embed(self, text: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, time.monotonic(), future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[tuple[str, float, asyncio.Future]]) -> None:
+        dispatched_at = time.monotonic()
+        for _, enqueued_at, _ in batch:
+            self.wait_time.observe(dispatched_at - enqueued_at)
+
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        self.batches += 1
+        self.batch_size.observe(len(texts))
+
+        try:
+            embeddings = dict(zip(texts, await self._request_embeddings(texts)))
+            for text, _, future in batch:
+                if not future.done():
+                    future.set_result(embeddings[text])
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+        finally:
+            # A cancelled request (shutdown, a cancelled batch task) must not
+            # leave its callers waiting forever.
+            for _, _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "batch_size": self.batch_size.snapshot(),
+            "wait_seconds": self.wait_time.snapshot(),
+        }
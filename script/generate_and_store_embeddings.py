@@ -3,9 +3,9 @@ import os
 from pathlib import Path
 
 import chromadb
-import requests
 
 from build_embedding_texts import build_embedding_texts, DATASET_PATH
+from upstream_http import get_upstream_http
 
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -34,7 +34,7 @@ def generate_embedding(text: str) -> list[float]:
         "model": MODEL,
         "input": text,
     }
-    response = requests.post(OPENROUTER_EMBEDDINGS_URL, headers=headers, json=payload)
+    response = get_upstream_http().post(OPENROUTER_EMBEDDINGS_URL, headers=headers, json=payload)
     response.raise_for_status()
     data = response.json()
     return data["data"][0]["embedding"]
@@ -75,8 +75,8 @@ def main() -> None:
     except Exception:
         pass
 
-    # Create collection
-    collection = client.create_collection(name=COLLECTION_NAME)
+    # Create collection in cosine space so distances map directly to similarity
+    collection = client.create_collection(name=COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
 
     # Prepare data for insertion
     ids: list[str] = []
@@ -116,6 +116,7 @@ def main() -> None:
     vector_dim = len(vectors[0])
     print(f"Total sections embedded: {EXPECTED_COUNT}")
     print(f"Chroma collection: {COLLECTION_NAME}")
+    print(f"Distance space: {collection.metadata.get('hnsw:space')}")
     print(f"Vector dimension: {vector_dim}")
     print(f"Persistence directory: {PERSIST_DIRECTORY}")
 
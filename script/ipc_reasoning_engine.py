@@ -1,15 +1,74 @@
+import asyncio
+import copy
+import hashlib
+import inspect
+import json
+import math
 import os
-
-import requests
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, AsyncIterator
 
 try:
-    from script.llm_instruction_template import build_ipc_reasoning_prompt
-    from script.retrieve_sections import _retrieve_with_scores
-    from script.llm_validation_guard import validate_llm_response
+    from script.bulkhead import Bulkhead, BulkheadFull
+    from script.caching import LRUTTLCache, SemanticCache, normalize_query_text
+    from script.circuit_breaker import CircuitBreaker, CircuitOpenError
+    from script.deadlines import (
+        DeadlineExceeded,
+        deadline_scope,
+        expired,
+        remaining,
+        remaining_timeout,
+        within_deadline,
+    )
+    from script.candidate_selection import (
+        CANDIDATE_ELBOW_MIN_DISTANCE,
+        CANDIDATE_GAP_RATIO,
+        CANDIDATE_MAX_K,
+        CANDIDATE_MIN_K,
+        CANDIDATE_POLICY,
+        select_candidates,
+    )
+    from script.llm_instruction_template import build_budgeted_prompt
+    from script.metrics import SIZE_BUCKETS, Histogram, registry, stage_timer
+    from script.request_coalescing import SingleFlight
+    from script.request_tracing import annotate
+    from script.retrieve_sections import (
+        MODEL as EMBEDDING_MODEL,
+        TOP_K,
+        RetrievalEngine,
+        _aretrieve_with_embedding,
+        _aretrieve_with_embedding_batch,
+        _aretrieve_with_scores,
+        _retrieve_with_embedding,
+        _retrieve_with_scores,
+        embedding_breaker,
+        embedding_bulkhead,
+        vector_bulkhead,
+    )
+    from script.llm_validation_guard import MIN_CONFIDENCE, validate_llm_response_with_reason
+    from script.section_catalog import DATASET_PATH
+    from script.upstream_http import get_upstream_http
 except ImportError:
-    from llm_instruction_template import build_ipc_reasoning_prompt
-    from retrieve_sections import _retrieve_with_scores
-    from llm_validation_guard import validate_llm_response
+    from bulkhead import Bulkhead, BulkheadFull
+    from caching import LRUTTLCache, SemanticCache, normalize_query_text
+    from circuit_breaker import CircuitBreaker, CircuitOpenError
+    from deadlines import DeadlineExceeded, deadline_scope, expired, remaining, remaining_timeout, within_deadline
+    from candidate_selection import CANDIDATE_ELBOW_MIN_DISTANCE, CANDIDATE_GAP_RATIO
+    from candidate_selection import CANDIDATE_MAX_K, CANDIDATE_MIN_K, CANDIDATE_POLICY, select_candidates
+    from llm_instruction_template import build_budgeted_prompt
+    from metrics import SIZE_BUCKETS, Histogram, registry, stage_timer
+    from request_coalescing import SingleFlight
+    from request_tracing import annotate
+    from retrieve_sections import MODEL as EMBEDDING_MODEL, TOP_K
+    from retrieve_sections import RetrievalEngine, _aretrieve_with_scores, _retrieve_with_scores
+    from retrieve_sections import _aretrieve_with_embedding, _retrieve_with_embedding
+    from retrieve_sections import _aretrieve_with_embedding_batch, embedding_breaker
+    from retrieve_sections import embedding_bulkhead, vector_bulkhead
+    from llm_validation_guard import MIN_CONFIDENCE, validate_llm_response_with_reason
+    from section_catalog import DATASET_PATH
+    from upstream_http import get_upstream_http
 
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -17,12 +76,126 @@ if not GEMINI_API_KEY:
     raise RuntimeError("GEMINI_API_KEY environment variable not set")
 
 GEMINI_MODEL = "models/gemini-2.5-flash"
-GEMINI_API_URL = (
-    "https://generativelanguage.googleapis.com/v1beta/"
-    f"{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+# Everything up to the model name; the benchmarks swap in their local Gemini stub here.
+GEMINI_API_BASE = os.getenv("IPC_GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta/")
+GEMINI_API_URL = f"{GEMINI_API_BASE.rstrip('/')}/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+
+# Minimum top-1 cosine similarity to call the LLM; calibrate with calibrate_similarity_gate.py.
+SIMILARITY_THRESHOLD = float(os.getenv("IPC_SIMILARITY_THRESHOLD", "0.25"))
+
+RESULT_CACHE_SIZE = int(os.getenv("IPC_RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("IPC_RESULT_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("IPC_SEMANTIC_CACHE_SIZE", "1024"))
+# Minimum cosine similarity between query embeddings for a verdict to be reused.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("IPC_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Decision paths. Only deterministic outcomes are eligible for the result cache.
+PATH_GATE_REJECTED = "gate_rejected"
+PATH_FAST_PATH = "fast_path"
+PATH_LLM = "llm"
+PATH_SEMANTIC_CACHE = "semantic_cache"
+PATH_UPSTREAM_ERROR = "upstream_error"
+PATH_DEADLINE_EXCEEDED = "deadline_exceeded"
+PATH_CIRCUIT_OPEN = "circuit_open"
+PATH_BULKHEAD_FULL = "bulkhead_full"
+# Answered from the result cache; the path that produced the cached answer is
+# attached to the request's trace as ``cached_decision_path``.
+PATH_RESULT_CACHE = "result_cache"
+CACHEABLE_PATHS = frozenset({PATH_GATE_REJECTED, PATH_FAST_PATH, PATH_LLM, PATH_SEMANTIC_CACHE})
+# Outcomes caused by an upstream failure or overload rather than by the incident;
+# the same text may well succeed on a later attempt.
+TRANSIENT_PATHS = frozenset({PATH_UPSTREAM_ERROR, PATH_DEADLINE_EXCEEDED, PATH_CIRCUIT_OPEN, PATH_BULKHEAD_FULL})
+
+# End-to-end budget for one prediction (embedding + vector search + Gemini); 0 disables.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("IPC_REQUEST_DEADLINE_SECONDS", "8"))
+# Hedged Gemini calls: a duplicate is sent once the first has run past the
+# LLM_HEDGE_QUANTILE latency observed so far (a fixed delay until enough samples).
+LLM_HEDGE_ENABLED = os.getenv("IPC_LLM_HEDGE_ENABLED", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("IPC_LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("IPC_LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("IPC_LLM_HEDGE_DEFAULT_DELAY_SECONDS", "3"))
+
+# Gemini calls slower than this count towards opening the Gemini breaker.
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("IPC_LLM_BREAKER_SLOW_CALL_SECONDS", "10"))
+# While the Gemini breaker is open, answer from retrieval alone instead of the fallback.
+BREAKER_RETRIEVAL_FALLBACK = os.getenv("IPC_BREAKER_RETRIEVAL_FALLBACK", "0") == "1"
+# Gemini bulkhead on the API path: concurrent calls and how many may wait for a
+# slot. 32 + 16 stays below IPC_MAX_IN_FLIGHT (64), so a slow Gemini is shed
+# here with bulkhead_full while admission still has room for other requests.
+LLM_CONCURRENCY = int(os.getenv("IPC_LLM_CONCURRENCY", "32"))
+LLM_QUEUE_SIZE = int(os.getenv("IPC_LLM_QUEUE_SIZE", "16"))
+
+# Maximum concurrent Gemini calls within one batch request.
+BATCH_LLM_CONCURRENCY = int(os.getenv("IPC_BATCH_LLM_CONCURRENCY", "8"))
+# Budget for a whole batch; items still waiting on an upstream then get deadline_exceeded. 0 disables.
+BATCH_DEADLINE_SECONDS = float(os.getenv("IPC_BATCH_DEADLINE_SECONDS", "60"))
+
+# Events yielded by astream_prediction.
+EVENT_CANDIDATES = "candidates"
+EVENT_DELTA = "delta"
+EVENT_RESULT = "result"
+
+# Retrieval-only answers for unambiguous matches; calibrate with calibrate_fast_path.py.
+FAST_PATH_ENABLED = os.getenv("IPC_FAST_PATH_ENABLED", "0") == "1"
+FAST_PATH_MIN_SIMILARITY = float(os.getenv("IPC_FAST_PATH_MIN_SIMILARITY", "0.75"))
+FAST_PATH_MIN_MARGIN = float(os.getenv("IPC_FAST_PATH_MIN_MARGIN", "0.10"))
+
+# Estimated prompt-token budget for the Gemini call; 0 disables compaction.
+PROMPT_MAX_TOKENS = int(os.getenv("IPC_PROMPT_MAX_TOKENS", "1200"))
+PROMPT_TOKEN_BUCKETS = (250, 500, 750, 1000, 1250, 1500, 2000, 3000)
+
+prediction_flights = SingleFlight()
+result_cache = LRUTTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_SECONDS)
+semantic_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
+prompt_tokens = Histogram(PROMPT_TOKEN_BUCKETS)
+prompt_candidates_dropped = Histogram((0, 1, 2, 3, 4, 5, 6))
+candidates_selected = Histogram(SIZE_BUCKETS)
+llm_latency = Histogram()
+registry.register_histogram("ipc_prompt_estimated_tokens", "Estimated Gemini prompt size in tokens.", prompt_tokens)
+registry.register_histogram("ipc_candidates_selected", "Candidate sections offered to Gemini.", candidates_selected)
+registry.register_histogram("ipc_llm_call_duration_seconds", "Successful Gemini call latency.", llm_latency)
+llm_counters = {"hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+llm_breaker = CircuitBreaker("gemini", LLM_BREAKER_SLOW_CALL_SECONDS)
+llm_bulkhead = Bulkhead("llm", LLM_CONCURRENCY, LLM_QUEUE_SIZE)
+fallbacks = registry.counter(
+    "ipc_fallbacks_total",
+    "Predictions that ended in the fallback (or a degraded answer), by reason.",
+    ("reason",),
 )
 
-SIMILARITY_THRESHOLD = -0.60
+
+def _file_digest(path: str | Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def pipeline_version() -> str:
+    """Fingerprint of everything that determines a prediction for a given text.
+
+    Covers the dataset, both models, the prompt template, candidate selection,
+    the validation guard and the retrieval/gate tuning, so any change yields a new version.
+    """
+    parts = [
+        _file_digest(DATASET_PATH),
+        EMBEDDING_MODEL,
+        GEMINI_MODEL,
+        _file_digest(inspect.getsourcefile(build_budgeted_prompt)),
+        _file_digest(inspect.getsourcefile(select_candidates)),
+        _file_digest(inspect.getsourcefile(validate_llm_response_with_reason)),
+        f"top_k={TOP_K}",
+        f"candidates={CANDIDATE_POLICY}:{CANDIDATE_MIN_K}-{CANDIDATE_MAX_K}",
+        f"candidate_cuts={CANDIDATE_GAP_RATIO}:{CANDIDATE_ELBOW_MIN_DISTANCE}",
+        f"similarity_threshold={SIMILARITY_THRESHOLD}",
+        f"min_confidence={MIN_CONFIDENCE}",
+        f"prompt_max_tokens={PROMPT_MAX_TOKENS}",
+        f"fast_path={FAST_PATH_ENABLED}:{FAST_PATH_MIN_SIMILARITY}:{FAST_PATH_MIN_MARGIN}",
+    ]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _prediction_key(incident_text: str) -> str:
+    return f"{pipeline_version()}:{normalize_query_text(incident_text)}"
+
 
 def _fallback_response() -> dict:
     return {
@@ -33,80 +206,548 @@ def _fallback_response() -> dict:
     }
 
 
-def run_similarity_gate(incident_text: str) -> dict:
+def _gate_candidates(incident_text: str, ranked_candidates: list[tuple[dict, float]]) -> dict:
+    if not ranked_candidates:
+        return _fallback_response()
+
+    top_similarity = float(ranked_candidates[0][1])
+    annotate(top_similarity=round(top_similarity, 4))
+    if top_similarity < SIMILARITY_THRESHOLD:
+        return _fallback_response()
+
+    selected = select_candidates(ranked_candidates)
+    candidates_selected.observe(len(selected))
+    candidate_sections = [metadata for metadata, _ in selected]
+    # Compaction may drop trailing candidates, so the allowed list comes from
+    # the builder and always matches what the prompt actually offers.
+    with stage_timer("prompt_build"):
+        built = build_budgeted_prompt(incident_text, candidate_sections, PROMPT_MAX_TOKENS)
+    stats = built["stats"]
+    prompt_tokens.observe(stats["estimated_tokens"])
+    prompt_candidates_dropped.observe(stats["candidates_in"] - stats["candidates_out"])
+    annotate(candidates=stats["candidates_out"], prompt_tokens=stats["estimated_tokens"])
+
+    return {
+        "incident_text": incident_text,
+        "candidate_sections": built["candidate_sections"],
+        "allowed_section_numbers": built["allowed_section_numbers"],
+        "llm_prompt": built["prompt"],
+        "prompt_stats": stats,
+    }
+
+
+def fast_path_eligible(
+    ranked_candidates: list[tuple[dict, float]],
+    min_similarity: float,
+    min_margin: float,
+) -> bool:
+    if not ranked_candidates:
+        return False
+    top_similarity = float(ranked_candidates[0][1])
+    if len(ranked_candidates) > 1:
+        margin = top_similarity - float(ranked_candidates[1][1])
+    else:
+        margin = math.inf
+    return top_similarity >= min_similarity and margin >= min_margin
+
+
+def _fast_path_response(ranked_candidates: list[tuple[dict, float]]) -> dict:
+    section, similarity = ranked_candidates[0]
+    section_number = str(section.get("section_number", "")).strip()
+    title = str(section.get("title", "")).strip()
+    summary = str(section.get("summary", "")).strip()
+
+    explanation = f"The incident closely matches IPC Section {section_number} ({title})."
+    if summary:
+        explanation += f" {summary}"
+
+    return {
+        "predicted_sections": [section_number],
+        "confidence": round(min(1.0, max(MIN_CONFIDENCE, float(similarity))), 2),
+        "explanation": explanation,
+        "title": title,
+    }
+
+
+def run_similarity_gate(incident_text: str, engine: RetrievalEngine | None = None) -> dict:
     try:
-        ranked_candidates = _retrieve_with_scores(incident_text)
-        if not ranked_candidates:
-            return _fallback_response()
-
-        top_similarity = float(ranked_candidates[0][1])
-        if top_similarity < SIMILARITY_THRESHOLD:
-            return _fallback_response()
-
-        candidate_sections = [metadata for metadata, _ in ranked_candidates]
-        allowed_section_numbers = [
-            str(section.get("section_number", "")).strip() for section in candidate_sections
-        ]
-
-        prompt = build_ipc_reasoning_prompt(incident_text, candidate_sections)
-
-        return {
-            "incident_text": incident_text,
-            "candidate_sections": candidate_sections,
-            "allowed_section_numbers": allowed_section_numbers,
-            "llm_prompt": prompt,
-        }
+        ranked_candidates = _retrieve_with_scores(incident_text, engine, CANDIDATE_MAX_K)
+        return _gate_candidates(incident_text, ranked_candidates)
     except Exception:
         return _fallback_response()
 
 
-def predict_ipc_section(incident_text: str) -> dict:
+async def arun_similarity_gate(incident_text: str, engine: RetrievalEngine | None = None) -> dict:
     try:
-        gate_result = run_similarity_gate(incident_text)
+        ranked_candidates = await _aretrieve_with_scores(incident_text, engine, CANDIDATE_MAX_K)
+        return _gate_candidates(incident_text, ranked_candidates)
+    except Exception:
+        return _fallback_response()
 
-        if "llm_prompt" not in gate_result:
-            gate_result.setdefault("title", "")
-            return gate_result
 
-        llm_prompt = gate_result["llm_prompt"]
-        allowed_section_numbers = gate_result["allowed_section_numbers"]
+def _gemini_payload(llm_prompt: str) -> dict:
+    return {
+        "contents": [
+            {
+                "parts": [{"text": llm_prompt}]
+            }
+        ],
+        "generationConfig": {
+            "temperature": 0.0,
+        },
+    }
+
+
+def _gemini_text(body: dict) -> str:
+    return body["candidates"][0]["content"]["parts"][0]["text"]
 
-        headers = {
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "contents": [
-                {
-                    "parts": [{"text": llm_prompt}]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.0,
-            },
-        }
 
-        response = requests.post(
+def _request_gemini(llm_prompt: str, timeout: float | None = None) -> str:
+    with llm_breaker.guard(), stage_timer("llm"):
+        response = get_upstream_http().post(
             GEMINI_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=60,
+            headers={"Content-Type": "application/json"},
+            json=_gemini_payload(llm_prompt),
+            timeout=timeout,
         )
         response.raise_for_status()
+    return _gemini_text(response.json())
 
-        body = response.json()
-        raw_response = body["candidates"][0]["content"]["parts"][0]["text"]
 
-        validated = validate_llm_response(raw_response, allowed_section_numbers)
+async def _arequest_gemini(llm_prompt: str, timeout: float | None = None) -> str:
+    async with llm_bulkhead.slot():
+        started_at = time.monotonic()
+        with llm_breaker.guard(), stage_timer("llm"):
+            response = await get_upstream_http().apost(
+                GEMINI_API_URL,
+                headers={"Content-Type": "application/json"},
+                json=_gemini_payload(llm_prompt),
+                timeout=timeout,
+            )
+            response.raise_for_status()
+        llm_latency.observe(time.monotonic() - started_at)
+    text = _gemini_text(response.json())
+    return text
 
-        title = ""
-        if validated.get("predicted_sections"):
-            predicted_section = str(validated["predicted_sections"][0]).strip()
-            for candidate in gate_result.get("candidate_sections", []):
-                if str(candidate.get("section_number", "")).strip() == predicted_section:
-                    title = str(candidate.get("title", "")).strip()
-                    break
 
-        validated["title"] = title
-        return validated
-    except Exception:
-        return _fallback_response()
\ No newline at end of file
+def _hedge_delay() -> float:
+    if llm_latency.count < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    return llm_latency.quantile(LLM_HEDGE_QUANTILE) or LLM_HEDGE_DEFAULT_DELAY_SECONDS
+
+
+async def _ahedged_gemini(llm_prompt: str) -> str:
+    """Call Gemini within the request deadline, hedging with a duplicate call when enabled.
+
+    The first call to succeed wins and the other is cancelled; a failure only
+    surfaces once no call is left running.
+    """
+    if not LLM_HEDGE_ENABLED:
+        return await within_deadline(_arequest_gemini(llm_prompt, remaining_timeout()))
+
+    primary = asyncio.ensure_future(_arequest_gemini(llm_prompt, remaining_timeout()))
+    pending = {primary}
+    try:
+        delay = _hedge_delay()
+        left = remaining()
+        done, pending = await asyncio.wait(pending, timeout=delay if left is None else min(delay, left))
+        if not done and not expired():
+            llm_counters["hedges"] += 1
+            pending.add(asyncio.ensure_future(_arequest_gemini(llm_prompt, remaining_timeout())))
+
+        error: BaseException | None = None
+        while done or pending:
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        llm_counters["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceeded("request deadline exceeded")
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _gemini_stream_url() -> str:
+    return GEMINI_API_URL.replace(":generateContent?", ":streamGenerateContent?alt=sse&", 1)
+
+
+def _gemini_chunk_text(body: dict) -> str:
+    # The closing chunk of a stream may carry only finishReason / usage metadata.
+    try:
+        return "".join(part.get("text", "") for part in body["candidates"][0]["content"]["parts"])
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+async def _astream_gemini(llm_prompt: str) -> AsyncIterator[str]:
+    async with llm_bulkhead.slot():
+        with llm_breaker.guard(), stage_timer("llm"):
+            async for text in _astream_gemini_unguarded(llm_prompt):
+                yield text
+
+
+async def _astream_gemini_unguarded(llm_prompt: str) -> AsyncIterator[str]:
+    async with get_upstream_http().astream(
+        _gemini_stream_url(),
+        headers={"Content-Type": "application/json"},
+        json=_gemini_payload(llm_prompt),
+        timeout=remaining_timeout(),
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            remaining_timeout()
+            if not line.startswith("data:"):
+                continue
+            text = _gemini_chunk_text(json.loads(line[len("data:"):]))
+            if text:
+                yield text
+
+
+def _finalize_prediction(gate_result: dict, raw_response: str) -> dict:
+    with stage_timer("validation"):
+        validated, reason = validate_llm_response_with_reason(raw_response, gate_result["allowed_section_numbers"])
+    if reason is not None:
+        fallbacks.inc(reason)
+
+    title = ""
+    if validated.get("predicted_sections"):
+        predicted_section = str(validated["predicted_sections"][0]).strip()
+        for candidate in gate_result.get("candidate_sections", []):
+            if str(candidate.get("section_number", "")).strip() == predicted_section:
+                title = str(candidate.get("title", "")).strip()
+                break
+
+    validated["title"] = title
+    return validated
+
+
+def _reuse_semantic_verdict(gate_result: dict, query_embedding: list[float] | None) -> dict | None:
+    if query_embedding is None:
+        return None
+    cached = semantic_cache.get(query_embedding, gate_result["allowed_section_numbers"])
+    if cached is None:
+        return None
+    return copy.deepcopy(cached)
+
+
+def _remember_semantic_verdict(
+    gate_result: dict,
+    query_embedding: list[float] | None,
+    result: dict,
+) -> None:
+    if query_embedding is not None:
+        semantic_cache.put(query_embedding, gate_result["allowed_section_numbers"], copy.deepcopy(result))
+
+
+def _decide_without_llm(
+    incident_text: str,
+    ranked_candidates: list[tuple[dict, float]],
+    query_embedding: list[float] | None,
+) -> tuple[dict, tuple[dict, str] | None]:
+    """Run the gate, fast path and semantic cache; the outcome is None when Gemini is needed."""
+    gate_result = _gate_candidates(incident_text, ranked_candidates)
+    if "llm_prompt" not in gate_result:
+        fallbacks.inc(PATH_GATE_REJECTED)
+        return gate_result, (gate_result, PATH_GATE_REJECTED)
+
+    if FAST_PATH_ENABLED and fast_path_eligible(
+        ranked_candidates, FAST_PATH_MIN_SIMILARITY, FAST_PATH_MIN_MARGIN
+    ):
+        return gate_result, (_fast_path_response(ranked_candidates), PATH_FAST_PATH)
+
+    reused = _reuse_semantic_verdict(gate_result, query_embedding)
+    if reused is not None:
+        return gate_result, (reused, PATH_SEMANTIC_CACHE)
+    return gate_result, None
+
+
+def _failure_outcome(
+    error: Exception,
+    ranked_candidates: list[tuple[dict, float]] | None = None,
+) -> tuple[dict, str]:
+    if expired():
+        llm_counters["deadline_exceeded"] += 1
+        fallbacks.inc(PATH_DEADLINE_EXCEEDED)
+        return _fallback_response(), PATH_DEADLINE_EXCEEDED
+    if isinstance(error, (CircuitOpenError, BulkheadFull)):
+        path = PATH_CIRCUIT_OPEN if isinstance(error, CircuitOpenError) else PATH_BULKHEAD_FULL
+        fallbacks.inc(path)
+        # Only reached past the similarity gate, so the top candidate is in range.
+        if BREAKER_RETRIEVAL_FALLBACK and ranked_candidates:
+            return _fast_path_response(ranked_candidates), path
+        return _fallback_response(), path
+    fallbacks.inc(PATH_UPSTREAM_ERROR)
+    return _fallback_response(), PATH_UPSTREAM_ERROR
+
+
+def _run_prediction(incident_text: str, engine: RetrievalEngine | None) -> tuple[dict, str]:
+    try:
+        ranked_candidates, query_embedding = _retrieve_with_embedding(incident_text, engine, CANDIDATE_MAX_K)
+    except Exception as exc:
+        return _failure_outcome(exc)
+
+    try:
+        gate_result, outcome = _decide_without_llm(incident_text, ranked_candidates, query_embedding)
+        if outcome is not None:
+            return outcome
+
+        raw_response = _request_gemini(gate_result["llm_prompt"], remaining_timeout())
+        result = _finalize_prediction(gate_result, raw_response)
+        _remember_semantic_verdict(gate_result, query_embedding, result)
+        return result, PATH_LLM
+    except Exception as exc:
+        return _failure_outcome(exc, ranked_candidates)
+
+
+async def _acomplete_prediction(
+    incident_text: str,
+    ranked_candidates: list[tuple[dict, float]],
+    query_embedding: list[float] | None,
+    llm_slots: asyncio.Semaphore | None = None,
+) -> tuple[dict, str]:
+    try:
+        gate_result, outcome = _decide_without_llm(incident_text, ranked_candidates, query_embedding)
+        if outcome is not None:
+            return outcome
+
+        if llm_slots is None:
+            raw_response = await _ahedged_gemini(gate_result["llm_prompt"])
+        else:
+            async with llm_slots:
+                raw_response = await _ahedged_gemini(gate_result["llm_prompt"])
+        result = _finalize_prediction(gate_result, raw_response)
+        _remember_semantic_verdict(gate_result, query_embedding, result)
+        return result, PATH_LLM
+    except Exception as exc:
+        return _failure_outcome(exc, ranked_candidates)
+
+
+async def _arun_prediction(incident_text: str, engine: RetrievalEngine | None) -> tuple[dict, str]:
+    try:
+        ranked_candidates, query_embedding = await _aretrieve_with_embedding(
+            incident_text, engine, CANDIDATE_MAX_K
+        )
+    except Exception as exc:
+        return _failure_outcome(exc)
+    return await _acomplete_prediction(incident_text, ranked_candidates, query_embedding)
+
+
+def _cached_outcome(key: str) -> tuple[dict, str] | None:
+    cached = result_cache.get(key)
+    if cached is None:
+        return None
+    result, decision_path = copy.deepcopy(cached)
+    annotate(cached_decision_path=decision_path)
+    return result, PATH_RESULT_CACHE
+
+
+def cached_prediction(incident_text: str) -> tuple[dict, str] | None:
+    """Result-cache lookup alone, so the API can answer a hit without taking an admission slot."""
+    return _cached_outcome(_prediction_key(incident_text))
+
+
+def _remember(key: str, outcome: tuple[dict, str]) -> None:
+    # Transient upstream failures must be retried on the next request, not replayed.
+    if outcome[1] in CACHEABLE_PATHS:
+        result_cache.put(key, copy.deepcopy(outcome))
+
+
+def predict_ipc_section_with_path(
+    incident_text: str,
+    engine: RetrievalEngine | None = None,
+) -> tuple[dict, str]:
+    key = _prediction_key(incident_text)
+    cached = _cached_outcome(key)
+    if cached is not None:
+        return cached
+
+    with deadline_scope(REQUEST_DEADLINE_SECONDS):
+        outcome = _run_prediction(incident_text, engine)
+    _remember(key, outcome)
+    return outcome
+
+
+def predict_ipc_section(incident_text: str, engine: RetrievalEngine | None = None) -> dict:
+    return predict_ipc_section_with_path(incident_text, engine)[0]
+
+
+async def apredict_ipc_section_with_path(
+    incident_text: str,
+    engine: RetrievalEngine | None = None,
+    check_cache: bool = True,
+) -> tuple[dict, str]:
+    key = _prediction_key(incident_text)
+    cached = _cached_outcome(key) if check_cache else None
+    if cached is not None:
+        return cached
+
+    async def _compute() -> tuple[dict, str]:
+        # The budget is set inside the shared flight so every stage awaited by it
+        # (embedding, vector query, Gemini) sees the same remaining time.
+        with deadline_scope(REQUEST_DEADLINE_SECONDS):
+            outcome = await _arun_prediction(incident_text, engine)
+        _remember(key, outcome)
+        return outcome
+
+    # Identical concurrent requests share one embedding + Gemini round-trip; the
+    # pipeline is deterministic, so every caller gets the same (copied) answer.
+    outcome = await prediction_flights.run(key, _compute)
+    return copy.deepcopy(outcome)
+
+
+async def apredict_ipc_section(incident_text: str, engine: RetrievalEngine | None = None) -> dict:
+    return (await apredict_ipc_section_with_path(incident_text, engine))[0]
+
+
+async def apredict_ipc_sections_batch(
+    incident_texts: list[str],
+    engine: RetrievalEngine | None = None,
+    llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+    check_cache: bool = True,
+) -> list[tuple[dict, str]]:
+    """Predict many incidents, returning ``(result, decision_path)`` in input order.
+
+    Cached and duplicate texts are answered once. The remaining texts share one
+    batched embedding round-trip and vector query, and at most
+    ``llm_concurrency`` Gemini calls run at a time. The batch shares one
+    ``BATCH_DEADLINE_SECONDS`` budget; items it cuts short come back as
+    ``deadline_exceeded``. Failures stay per item.
+    """
+    keys = [_prediction_key(text) for text in incident_texts]
+    outcomes: dict[str, tuple[dict, str]] = {}
+    pending: dict[str, str] = {}
+    for key, text in zip(keys, incident_texts):
+        if key in outcomes or key in pending:
+            continue
+        cached = _cached_outcome(key) if check_cache else None
+        if cached is not None:
+            outcomes[key] = cached
+        else:
+            pending[key] = text
+
+    if pending:
+        texts = list(pending.values())
+        with deadline_scope(BATCH_DEADLINE_SECONDS):
+            try:
+                retrieved = await within_deadline(_aretrieve_with_embedding_batch(texts, engine, CANDIDATE_MAX_K))
+            except Exception as exc:
+                retrieved = None
+                failure = _failure_outcome(exc)
+
+            if retrieved is None:
+                decided = [copy.deepcopy(failure) for _ in texts]
+            else:
+                llm_slots = asyncio.Semaphore(max(1, llm_concurrency))
+                decided = await asyncio.gather(
+                    *(
+                        _acomplete_prediction(text, ranked_candidates, query_embedding, llm_slots)
+                        for text, (ranked_candidates, query_embedding) in zip(texts, retrieved)
+                    )
+                )
+        for key, outcome in zip(pending, decided):
+            _remember(key, outcome)
+            outcomes[key] = outcome
+
+    return [copy.deepcopy(outcomes[key]) for key in keys]
+
+
+async def astream_prediction(
+    incident_text: str,
+    engine: RetrievalEngine | None = None,
+    check_cache: bool = True,
+) -> AsyncIterator[tuple[str, Any]]:
+    """Yield prediction progress as ``(event, data)`` pairs.
+
+    ``candidates`` (retrieved sections with similarities) comes first, then a
+    ``delta`` per chunk of raw Gemini output when the LLM is called, and always
+    a final ``result`` carrying the validated ``(result, decision_path)``. Deltas
+    are unvalidated; only ``result`` is authoritative.
+    """
+    key = _prediction_key(incident_text)
+    cached = _cached_outcome(key) if check_cache else None
+    if cached is not None:
+        yield EVENT_RESULT, cached
+        return
+
+    with deadline_scope(REQUEST_DEADLINE_SECONDS):
+        async for event in _astream_uncached(incident_text, key, engine):
+            yield event
+
+
+async def _astream_uncached(
+    incident_text: str,
+    key: str,
+    engine: RetrievalEngine | None,
+) -> AsyncIterator[tuple[str, Any]]:
+    try:
+        ranked_candidates, query_embedding = await _aretrieve_with_embedding(
+            incident_text, engine, CANDIDATE_MAX_K
+        )
+    except Exception as exc:
+        yield EVENT_RESULT, _failure_outcome(exc)
+        return
+
+    yield EVENT_CANDIDATES, [
+        {
+            "section_number": str(section.get("section_number", "")).strip(),
+            "title": str(section.get("title", "")).strip(),
+            "similarity": round(float(similarity), 4),
+        }
+        for section, similarity in ranked_candidates
+    ]
+
+    try:
+        gate_result, outcome = _decide_without_llm(incident_text, ranked_candidates, query_embedding)
+        if outcome is None:
+            chunks: list[str] = []
+            async for text in _astream_gemini(gate_result["llm_prompt"]):
+                chunks.append(text)
+                yield EVENT_DELTA, text
+            result = _finalize_prediction(gate_result, "".join(chunks))
+            _remember_semantic_verdict(gate_result, query_embedding, result)
+            outcome = (result, PATH_LLM)
+    except Exception as exc:
+        outcome = _failure_outcome(exc, ranked_candidates)
+
+    _remember(key, outcome)
+    yield EVENT_RESULT, copy.deepcopy(outcome)
+
+
+def prompt_stats() -> dict:
+    return {
+        "max_tokens": PROMPT_MAX_TOKENS or None,
+        "candidate_policy": CANDIDATE_POLICY,
+        "candidates_selected": candidates_selected.snapshot(),
+        "estimated_tokens": prompt_tokens.snapshot(),
+        "candidates_dropped": prompt_candidates_dropped.snapshot(),
+    }
+
+
+def llm_stats() -> dict:
+    return {
+        "deadline_seconds": REQUEST_DEADLINE_SECONDS or None,
+        "hedge_enabled": LLM_HEDGE_ENABLED,
+        "hedge_delay_seconds": round(_hedge_delay(), 4) if LLM_HEDGE_ENABLED else None,
+        "latency": llm_latency.snapshot(),
+        **llm_counters,
+    }
+
+
+def circuit_breaker_stats() -> dict:
+    return {
+        embedding_breaker.name: embedding_breaker.stats(),
+        llm_breaker.name: llm_breaker.stats(),
+    }
+
+
+def bulkhead_stats() -> dict:
+    return {bulkhead.name: bulkhead.stats() for bulkhead in (embedding_bulkhead, vector_bulkhead, llm_bulkhead)}
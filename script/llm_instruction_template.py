@@ -1,38 +1,73 @@
 import json
+import math
+import re
 
 
-def build_ipc_reasoning_prompt(incident_text: str, candidate_sections: list[dict]) -> str:
-    allowed_section_numbers = [
-        str(section.get("section_number", "")).strip() for section in candidate_sections
-    ]
+# Rough chars-per-token ratio for English prose under Gemini's tokenizer.
+CHARS_PER_TOKEN = 4.0
+MIN_BUDGET_CANDIDATES = 1
 
-    candidate_blocks: list[str] = []
-    for section in candidate_sections:
-        section_number = str(section.get("section_number", "")).strip()
-        title = str(section.get("title", "")).strip()
-        summary = str(section.get("summary", "")).strip()
-        keywords = section.get("keywords", [])
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
 
-        if isinstance(keywords, list):
-            keywords_text = ", ".join(str(item).strip() for item in keywords)
-        else:
-            keywords_text = str(keywords).strip()
+_DECISION_RULES = (
+    "Decision Rules:\n"
+    "1. Select exactly one section number or return an empty list.\n"
+    "2. You may choose only from Allowed Section Numbers.\n"
+    "3. If no section is even remotely applicable, return an empty list.\n"
+    "4. Select the most applicable section even if the match is partial.\n"
+    "5. Return an empty list only when NO candidate section is genuinely relevant.\n"
+    "6. Confidence must be a float between 0.0 and 1.0.\n"
+    "7. Output must be strict JSON only.\n"
+    "8. Do not output markdown.\n"
+    "9. Do not output backticks.\n"
+    "10. Do not output additional commentary.\n"
+    "11. Do not output additional keys.\n"
+    "12. predicted_sections must contain at most one element.\n"
+    "13. confidence must be a numeric value (not a string).\n"
+    "14. Set confidence above 0.3 if the section is a reasonable match.\n\n"
+)
 
-        candidate_blocks.append(
-            "\n".join(
-                [
-                    "Section Number: " + section_number,
-                    "Title: " + title,
-                    "Summary: " + summary,
-                    "Keywords: " + keywords_text,
-                ]
-            )
-        )
+# Same constraints as _DECISION_RULES with the output-format rules merged.
+_COMPACT_DECISION_RULES = (
+    "Decision Rules:\n"
+    "1. Select exactly one section number from Allowed Section Numbers, or return an empty list.\n"
+    "2. Select the most applicable section even if the match is partial; return an empty list only when NO candidate is genuinely relevant.\n"
+    "3. confidence is a numeric float between 0.0 and 1.0; set it above 0.3 if the section is a reasonable match.\n"
+    "4. Output strict JSON only: no markdown, backticks, commentary or additional keys.\n\n"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
 
+
+def _keywords_list(keywords: object) -> list[str]:
+    if isinstance(keywords, (list, tuple)):
+        return [str(item).strip() for item in keywords]
+    return [str(keywords).strip()]
+
+
+def _candidate_block(section_number: str, title: str, summary: str, keywords: list[str]) -> str:
+    return "\n".join(
+        [
+            "Section Number: " + section_number,
+            "Title: " + title,
+            "Summary: " + summary,
+            "Keywords: " + ", ".join(keywords),
+        ]
+    )
+
+
+def _render_prompt(
+    incident_text: str,
+    allowed_section_numbers: list[str],
+    candidate_blocks: list[str],
+    decision_rules: str,
+) -> str:
     allowed_list_text = json.dumps(allowed_section_numbers, ensure_ascii=False)
     candidates_text = "\n\n".join(candidate_blocks)
 
-    prompt = (
+    return (
         "You are a legal reasoning assistant for IPC section prediction.\n"
         "You are strictly restricted to the provided candidate sections.\n"
         "You are not allowed to invent, infer, or reference any section outside the allowed list.\n\n"
@@ -42,21 +77,7 @@ def build_ipc_reasoning_prompt(incident_text: str, candidate_sections: list[dict
         f"{candidates_text}\n\n"
         "Incident Description:\n"
         f"{incident_text.strip()}\n\n"
-        "Decision Rules:\n"
-        "1. Select exactly one section number or return an empty list.\n"
-        "2. You may choose only from Allowed Section Numbers.\n"
-        "3. If no section is even remotely applicable, return an empty list.\n"
-        "4. Select the most applicable section even if the match is partial.\n"
-        "5. Return an empty list only when NO candidate section is genuinely relevant.\n"
-        "6. Confidence must be a float between 0.0 and 1.0.\n"
-        "7. Output must be strict JSON only.\n"
-        "8. Do not output markdown.\n"
-        "9. Do not output backticks.\n"
-        "10. Do not output additional commentary.\n"
-        "11. Do not output additional keys.\n"
-        "12. predicted_sections must contain at most one element.\n"
-        "13. confidence must be a numeric value (not a string).\n"
-        "14. Set confidence above 0.3 if the section is a reasonable match.\n\n"
+        f"{decision_rules}"
         "Output Schema:\n"
         "{\n"
         "  \"predicted_sections\": [\"<section_number>\"] OR [],\n"
@@ -65,4 +86,131 @@ def build_ipc_reasoning_prompt(incident_text: str, candidate_sections: list[dict
         "}\n\n"
         "Return ONLY valid JSON."
     )
-    return prompt
\ No newline at end of file
+
+
+def build_ipc_reasoning_prompt(incident_text: str, candidate_sections: list[dict]) -> str:
+    allowed_section_numbers = [
+        str(section.get("section_number", "")).strip() for section in candidate_sections
+    ]
+
+    candidate_blocks: list[str] = []
+    for section in candidate_sections:
+        candidate_blocks.append(
+            _candidate_block(
+                str(section.get("section_number", "")).strip(),
+                str(section.get("title", "")).strip(),
+                str(section.get("summary", "")).strip(),
+                _keywords_list(section.get("keywords", [])),
+            )
+        )
+
+    return _render_prompt(incident_text, allowed_section_numbers, candidate_blocks, _DECISION_RULES)
+
+
+def build_budgeted_prompt(
+    incident_text: str,
+    candidate_sections: list[dict],
+    max_tokens: int | None = None,
+) -> dict:
+    """Build the reasoning prompt within an estimated token budget.
+
+    ``candidate_sections`` must be ordered by descending similarity. A prompt
+    that fits the budget (or any prompt, without one) is identical to
+    ``build_ipc_reasoning_prompt``. Only an over-budget prompt is compacted, a
+    step at a time until it fits: compact rules, then keywords already listed
+    for a higher-ranked candidate are dropped, then summaries are shortened a
+    sentence at a time, and finally the lowest-ranked candidates are dropped.
+    The returned ``candidate_sections`` and ``allowed_section_numbers``
+    describe exactly what the prompt offers.
+    """
+    budget = max_tokens if max_tokens and max_tokens > 0 else None
+    prompt = build_ipc_reasoning_prompt(incident_text, candidate_sections)
+    if budget is None or estimate_tokens(prompt) <= budget:
+        allowed = [str(section.get("section_number", "")).strip() for section in candidate_sections]
+        return {
+            "prompt": prompt,
+            "candidate_sections": list(candidate_sections),
+            "allowed_section_numbers": allowed,
+            "stats": {
+                "estimated_tokens": estimate_tokens(prompt),
+                "max_tokens": budget,
+                "candidates_in": len(candidate_sections),
+                "candidates_out": len(candidate_sections),
+                "compact_rules": False,
+                "keywords_deduped": 0,
+                "summary_sentences": None,
+            },
+        }
+
+    entries: list[dict] = []
+    seen_keywords: set[str] = set()
+    duplicate_keywords = 0
+    for section in candidate_sections:
+        keywords = _keywords_list(section.get("keywords", []))
+        unique_keywords: list[str] = []
+        for keyword in keywords:
+            folded = keyword.casefold()
+            if not keyword or folded in seen_keywords:
+                duplicate_keywords += 1
+                continue
+            seen_keywords.add(folded)
+            unique_keywords.append(keyword)
+        entries.append(
+            {
+                "section": section,
+                "section_number": str(section.get("section_number", "")).strip(),
+                "title": str(section.get("title", "")).strip(),
+                "sentences": _SENTENCE_BOUNDARY.split(str(section.get("summary", "")).strip()),
+                "keywords": keywords,
+                "unique_keywords": unique_keywords,
+            }
+        )
+
+    def _render(included: list[dict], dedupe: bool, sentence_limit: int | None) -> str:
+        blocks = [
+            _candidate_block(
+                entry["section_number"],
+                entry["title"],
+                " ".join(entry["sentences"][:sentence_limit]),
+                entry["unique_keywords"] if dedupe else entry["keywords"],
+            )
+            for entry in included
+        ]
+        allowed = [entry["section_number"] for entry in included]
+        return _render_prompt(incident_text, allowed, blocks, _COMPACT_DECISION_RULES)
+
+    included = entries
+    dedupe = False
+    sentence_limit: int | None = None
+    prompt = _render(included, dedupe, sentence_limit)
+
+    if estimate_tokens(prompt) > budget:
+        dedupe = True
+        prompt = _render(included, dedupe, sentence_limit)
+
+    # Shorten every summary one sentence at a time, keeping at least one sentence.
+    limit = max((len(entry["sentences"]) for entry in entries), default=1) - 1
+    while estimate_tokens(prompt) > budget and limit >= 1:
+        sentence_limit = limit
+        prompt = _render(included, dedupe, sentence_limit)
+        limit -= 1
+
+    # Drop the lowest-similarity candidates last; candidates arrive best-first.
+    while estimate_tokens(prompt) > budget and len(included) > MIN_BUDGET_CANDIDATES:
+        included = included[:-1]
+        prompt = _render(included, dedupe, sentence_limit)
+
+    return {
+        "prompt": prompt,
+        "candidate_sections": [entry["section"] for entry in included],
+        "allowed_section_numbers": [entry["section_number"] for entry in included],
+        "stats": {
+            "estimated_tokens": estimate_tokens(prompt),
+            "max_tokens": budget,
+            "candidates_in": len(candidate_sections),
+            "candidates_out": len(included),
+            "compact_rules": True,
+            "keywords_deduped": duplicate_keywords if dedupe else 0,
+            "summary_sentences": sentence_limit,
+        },
+    }
@@ -7,6 +7,14 @@ MIN_CONFIDENCE = 0.30
 
 _REQUIRED_KEYS = {"predicted_sections", "confidence", "explanation"}
 
+# Why validate_llm_response_with_reason fell back.
+REASON_JSON_INVALID = "json_invalid"
+REASON_SCHEMA_INVALID = "schema_invalid"
+# Not a malformed answer: the model said no candidate section applies.
+REASON_NO_SECTION = "no_section"
+REASON_SECTION_NOT_ALLOWED = "section_not_allowed"
+REASON_LOW_CONFIDENCE = "low_confidence"
+
 
 def _fallback_response() -> dict:
     return {
@@ -35,72 +43,80 @@ def _strip_markdown_fences(text: str) -> str:
     return stripped
 
 
-def validate_llm_response(raw_response: str, allowed_section_numbers: list[str]) -> dict:
+def validate_llm_response_with_reason(raw_response: str, allowed_section_numbers: list[str]) -> tuple[dict, str | None]:
+    """Validate like ``validate_llm_response``, also returning why a fallback was chosen (``None`` if valid)."""
     try:
         cleaned = _strip_markdown_fences(raw_response)
         try:
             parsed = json.loads(cleaned)
         except json.JSONDecodeError:
-            return _fallback_response()
+            return _fallback_response(), REASON_JSON_INVALID
 
         if not isinstance(parsed, dict):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         # Accept response if it contains at least the required keys (ignore extras)
         if not _REQUIRED_KEYS.issubset(set(parsed.keys())):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         predicted_sections = parsed.get("predicted_sections")
         confidence = parsed.get("confidence")
         explanation = parsed.get("explanation")
 
         if not isinstance(predicted_sections, list):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
+
+        if not predicted_sections:
+            return _fallback_response(), REASON_NO_SECTION
 
         if len(predicted_sections) != 1:
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         section_value = predicted_sections[0]
         if not isinstance(section_value, str):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         # Strip whitespace from section number instead of rejecting
         sanitized_section = section_value.strip()
         if not sanitized_section:
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         allowed_set = _normalize_allowed_sections(allowed_section_numbers)
         if sanitized_section not in allowed_set:
-            return _fallback_response()
+            return _fallback_response(), REASON_SECTION_NOT_ALLOWED
 
         if isinstance(confidence, str):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         if not isinstance(confidence, (int, float)):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         confidence_value = float(confidence)
         if not math.isfinite(confidence_value):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         clamped_confidence = max(0.0, min(1.0, confidence_value))
         if not (0.0 <= clamped_confidence <= 1.0):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         if clamped_confidence < MIN_CONFIDENCE:
-            return _fallback_response()
+            return _fallback_response(), REASON_LOW_CONFIDENCE
 
         if not isinstance(explanation, str):
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         sanitized_explanation = explanation.strip()
         if not sanitized_explanation:
-            return _fallback_response()
+            return _fallback_response(), REASON_SCHEMA_INVALID
 
         return {
             "predicted_sections": [sanitized_section],
             "confidence": clamped_confidence,
             "explanation": sanitized_explanation,
-        }
+        }, None
     except Exception:
-        return _fallback_response()
\ No newline at end of file
+        return _fallback_response(), REASON_SCHEMA_INVALID
+
+
+def validate_llm_response(raw_response: str, allowed_section_numbers: list[str]) -> dict:
+    return validate_llm_response_with_reason(raw_response, allowed_section_numbers)[0]
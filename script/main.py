@@ -1,16 +1,101 @@
+import json
+import logging
+import os
 import random
+import sys
+from contextlib import asynccontextmanager
+from typing import Any
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
 try:
-    from script.schemas import CaseInput
-    from script.ipc_reasoning_engine import predict_ipc_section
+    from script.admission_control import AdmissionController, Overloaded
+    from script.metrics import registry
+    from script.request_tracing import RequestTrace, SlowRequestProfiler, trace_request
+    from script.schemas import BatchCaseInput, CaseInput
+    from script.ipc_reasoning_engine import (
+        EVENT_RESULT,
+        GEMINI_API_URL,
+        PATH_BULKHEAD_FULL,
+        PATH_CIRCUIT_OPEN,
+        PATH_DEADLINE_EXCEEDED,
+        PATH_UPSTREAM_ERROR,
+        apredict_ipc_section_with_path,
+        apredict_ipc_sections_batch,
+        astream_prediction,
+        bulkhead_stats,
+        cached_prediction,
+        circuit_breaker_stats,
+        llm_stats,
+        prediction_flights,
+        prompt_stats,
+        result_cache,
+        semantic_cache,
+    )
+    from script.retrieve_sections import (
+        OPENROUTER_EMBEDDINGS_URL,
+        embedding_batcher,
+        embedding_cache,
+        get_retrieval_engine,
+        vector_bulkhead,
+    )
+    from script.upstream_http import get_upstream_http
 except ImportError:
-    from schemas import CaseInput
-    from ipc_reasoning_engine import predict_ipc_section
+    from admission_control import AdmissionController, Overloaded
+    from metrics import registry
+    from request_tracing import RequestTrace, SlowRequestProfiler, trace_request
+    from schemas import BatchCaseInput, CaseInput
+    from ipc_reasoning_engine import (
+        EVENT_RESULT,
+        GEMINI_API_URL,
+        PATH_BULKHEAD_FULL,
+        PATH_CIRCUIT_OPEN,
+        PATH_DEADLINE_EXCEEDED,
+        PATH_UPSTREAM_ERROR,
+        apredict_ipc_section_with_path,
+        apredict_ipc_sections_batch,
+        astream_prediction,
+        bulkhead_stats,
+        cached_prediction,
+        circuit_breaker_stats,
+        llm_stats,
+        prediction_flights,
+        prompt_stats,
+        result_cache,
+        semantic_cache,
+    )
+    from retrieve_sections import (
+        OPENROUTER_EMBEDDINGS_URL,
+        embedding_batcher,
+        embedding_cache,
+        get_retrieval_engine,
+        vector_bulkhead,
+    )
+    from upstream_http import get_upstream_http
 
-app = FastAPI(title="IPC Prediction API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    engine = get_retrieval_engine()
+    engine.open()
+    app.state.retrieval_engine = engine
+
+    upstream = get_upstream_http()
+    app.state.upstream_warm = await upstream.awarm_up([OPENROUTER_EMBEDDINGS_URL, GEMINI_API_URL])
+    try:
+        yield
+    finally:
+        await upstream.aclose()
+        upstream.close()
+        engine.close()
+        vector_bulkhead.close()
+        embedding_cache.close()
+
+
+app = FastAPI(title="IPC Prediction API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +105,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+admission = AdmissionController()
+profiler = SlowRequestProfiler()
+
+# One JSON line per /ipc/predict request with stage timings; IPC_REQUEST_LOG=0 turns it off.
+REQUEST_LOG_ENABLED = os.getenv("IPC_REQUEST_LOG", "1") == "1"
+request_log = logging.getLogger("ipc.requests")
+if not request_log.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    request_log.addHandler(_handler)
+    request_log.setLevel(logging.INFO)
+    request_log.propagate = False
+
+
+def _overloaded_response(exc: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": "Server is busy, please retry later.", "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return _overloaded_response(exc)
+
+
+predictions = registry.counter(
+    "ipc_predictions_total",
+    "Prediction responses by endpoint and decision path.",
+    ("endpoint", "decision_path"),
+)
+
+
+def _cache_lookups():
+    embedding = embedding_cache.stats()
+    yield ("embedding", "hit"), embedding["memory_hits"] + embedding["disk_hits"]
+    yield ("embedding", "miss"), embedding["misses"]
+    for name, cache in (("result", result_cache), ("semantic", semantic_cache)):
+        stats = cache.stats()
+        yield (name, "hit"), stats["hits"]
+        yield (name, "miss"), stats["misses"]
+
+
+def _in_flight():
+    yield ("admission",), admission.in_flight
+    yield ("prediction_flights",), prediction_flights.stats()["in_flight"]
+    for stage, stats in bulkhead_stats().items():
+        yield (stage,), stats["active"]
+
+
+def _queued():
+    yield ("admission",), admission.stats()["queued"]
+    for stage, stats in bulkhead_stats().items():
+        yield (stage,), stats["queued"]
+
+
+def _rejections():
+    yield ("admission", "queue_full"), admission.rejected_queue_full
+    yield ("admission", "queue_timeout"), admission.rejected_queue_timeout
+    for stage, stats in bulkhead_stats().items():
+        yield (stage, "bulkhead_full"), stats["rejected"]
+    for upstream, stats in circuit_breaker_stats().items():
+        yield (upstream, "circuit_open"), stats["rejected"]
+
+
+def _breaker_states():
+    for upstream, stats in circuit_breaker_stats().items():
+        for state in ("closed", "open", "half_open"):
+            yield (upstream, state), int(stats["state"] == state)
+
+
+registry.callback(
+    "ipc_cache_lookups_total", "counter", "Cache lookups by cache and result.", ("cache", "result"), _cache_lookups
+)
+registry.callback("ipc_in_flight", "gauge", "Work currently running, by component.", ("component",), _in_flight)
+registry.callback("ipc_queued", "gauge", "Work waiting for a slot, by component.", ("component",), _queued)
+registry.callback(
+    "ipc_rejected_total",
+    "counter",
+    "Requests failed fast, by component and reason.",
+    ("component", "reason"),
+    _rejections,
+)
+registry.callback(
+    "ipc_circuit_breaker_state", "gauge", "1 for each breaker's current state.", ("upstream", "state"), _breaker_states
+)
+
+# Decision paths reported as the item error in batch responses.
+BATCH_ERROR_PATHS = frozenset({PATH_UPSTREAM_ERROR, PATH_DEADLINE_EXCEEDED, PATH_CIRCUIT_OPEN, PATH_BULKHEAD_FULL})
+
 SUGGESTIONS = [
     "Consider consulting a legal professional.",
     "You may approach the nearest police station.",
@@ -29,19 +205,46 @@ SUGGESTIONS = [
 ]
 
 
-@app.post("/ipc/predict")
-def predict_ipc(case: CaseInput):
-    raw_text = case.text.strip()
+@app.get("/health")
+def health():
+    return {
+        "retrieval": app.state.retrieval_engine.health(),
+        "upstream_warm": app.state.upstream_warm,
+        "circuit_breakers": {name: breaker["state"] for name, breaker in circuit_breaker_stats().items()},
+    }
 
-    if not raw_text or len(raw_text) < 10:
-        return {
-            "prediction": None,
-            "message": "Please describe the incident with sufficient details.",
-            "disclaimer": "This tool requires incident details to provide a legal prediction.",
-        }
 
-    rag_output = predict_ipc_section(raw_text)
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
+
+@app.get("/ipc/stats")
+def stats():
+    return {
+        "admission": admission.stats(),
+        "bulkheads": bulkhead_stats(),
+        "circuit_breakers": circuit_breaker_stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "prediction_coalescing": prediction_flights.stats(),
+        "llm": llm_stats(),
+        "profiler": profiler.stats(),
+        "prompt": prompt_stats(),
+        "result_cache": result_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+    }
+
+
+def _insufficient_input_response() -> dict:
+    return {
+        "prediction": None,
+        "message": "Please describe the incident with sufficient details.",
+        "disclaimer": "This tool requires incident details to provide a legal prediction.",
+    }
+
+
+def _prediction_response(rag_output: dict) -> dict:
     if rag_output.get("predicted_sections"):
         ipc_code = rag_output["predicted_sections"][0]
         title = rag_output.get("title", "")
@@ -66,3 +269,146 @@ def predict_ipc(case: CaseInput):
         "suggestion": suggestion,
         "disclaimer": "This is an AI-assisted legal awareness tool.",
     }
+
+
+def _finish_predict_trace(
+    trace: RequestTrace,
+    response: Response,
+    decision_path: str | None,
+    **fields: Any,
+) -> None:
+    if decision_path is not None:
+        response.headers["X-IPC-Decision-Path"] = decision_path
+    response.headers["Server-Timing"] = trace.server_timing()
+    if REQUEST_LOG_ENABLED:
+        request_log.info(
+            json.dumps(
+                {"endpoint": "/ipc/predict", "decision_path": decision_path, **fields, **trace.to_log_record()}
+            )
+        )
+
+
+@app.post("/ipc/predict")
+async def predict_ipc(case: CaseInput, response: Response):
+    raw_text = case.text.strip()
+
+    # Every exit, short input and shed requests included, gets Server-Timing and a log line.
+    with trace_request() as trace, profiler.profile(trace):
+        if not raw_text or len(raw_text) < 10:
+            _finish_predict_trace(trace, response, None, error="insufficient_input")
+            return _insufficient_input_response()
+
+        # A result-cache hit needs no upstream work, so it never waits behind admission.
+        outcome = cached_prediction(raw_text)
+        if outcome is None:
+            try:
+                async with admission.slot():
+                    outcome = await apredict_ipc_section_with_path(
+                        raw_text, app.state.retrieval_engine, check_cache=False
+                    )
+            except Overloaded as exc:
+                shed = _overloaded_response(exc)
+                _finish_predict_trace(trace, shed, None, error=exc.reason, status=exc.status_code)
+                return shed
+        rag_output, decision_path = outcome
+        _finish_predict_trace(trace, response, decision_path)
+    predictions.inc("predict", decision_path)
+    return _prediction_response(rag_output)
+
+
+@app.post("/ipc/predict/batch")
+async def predict_ipc_batch(batch: BatchCaseInput):
+    texts = [case.text.strip() for case in batch.cases]
+    eligible = [i for i, text in enumerate(texts) if text and len(text) >= 10]
+
+    results: list[dict] = [
+        {
+            "index": i,
+            "decision_path": None,
+            "error": "insufficient_input",
+            "result": _insufficient_input_response(),
+        }
+        for i in range(len(texts))
+    ]
+
+    cached = {i: cached_prediction(texts[i]) for i in eligible}
+    pending = [i for i in eligible if cached[i] is None]
+    if pending:
+        async with admission.slot():
+            computed = await apredict_ipc_sections_batch(
+                [texts[i] for i in pending], app.state.retrieval_engine, check_cache=False
+            )
+        cached.update(zip(pending, computed))
+
+    for i in eligible:
+        rag_output, decision_path = cached[i]
+        predictions.inc("batch", decision_path)
+        results[i] = {
+            "index": i,
+            "decision_path": decision_path,
+            "error": decision_path if decision_path in BATCH_ERROR_PATHS else None,
+            "result": _prediction_response(rag_output),
+        }
+
+    return {"count": len(results), "results": results}
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _cached_events(outcome: tuple[dict, str]):
+    yield EVENT_RESULT, outcome
+
+
+@app.post("/ipc/predict/stream")
+async def predict_ipc_stream(case: CaseInput):
+    raw_text = case.text.strip()
+    engine = app.state.retrieval_engine
+
+    sufficient = bool(raw_text) and len(raw_text) >= 10
+    cached = cached_prediction(raw_text) if sufficient else None
+    # Admit before the stream starts so a shed request gets a real 429/503;
+    # cache hits skip admission like they do on /ipc/predict.
+    needs_slot = sufficient and cached is None
+    if needs_slot:
+        await admission.acquire()
+    released = not needs_slot
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            admission.release()
+
+    async def events():
+        # Starlette skips background tasks when the body raises or (ASGI spec
+        # 2.4+) the client disconnects, so the generator releases the slot
+        # itself; the background task only covers a body that never started.
+        try:
+            if not sufficient:
+                yield _sse("result", _insufficient_input_response())
+                yield _sse("done", {"decision_path": None})
+                return
+
+            if cached is not None:
+                stream = _cached_events(cached)
+            else:
+                stream = astream_prediction(raw_text, engine, check_cache=False)
+            async for event, data in stream:
+                if event == EVENT_RESULT:
+                    rag_output, decision_path = data
+                    predictions.inc("stream", decision_path)
+                    yield _sse("result", _prediction_response(rag_output))
+                    yield _sse("done", {"decision_path": decision_path})
+                else:
+                    yield _sse(event, data)
+        finally:
+            release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release) if needs_slot else None,
+    )
@@ -0,0 +1,216 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator
+
+try:
+    from script.request_tracing import record_stage
+except ImportError:
+    from request_tracing import record_stage
+
+
+LATENCY_BUCKETS_SECONDS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``observe`` is a bisect plus two additions under a lock."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS_SECONDS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[position] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate the ``q`` quantile by interpolating linearly inside its bucket."""
+        with self._lock:
+            counts = list(self._counts)
+            count = self._count
+        if count == 0:
+            return None
+
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = bound
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+            count = self._count
+
+        cumulative = 0
+        buckets: dict[str, int] = {}
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            buckets[f"{bound:g}"] = cumulative
+        buckets["+Inf"] = count
+        return {"count": count, "sum": total, "buckets": buckets}
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label_value(str(value))}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label-value tuple; ``inc`` is a dict update under a lock."""
+
+    def __init__(self, labelnames: tuple[str, ...] = ()) -> None:
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> list[tuple[tuple[str, ...], float]]:
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class HistogramFamily:
+    """One ``Histogram`` per label-value tuple, created on first use."""
+
+    def __init__(self, labelnames: tuple[str, ...], buckets: tuple[float, ...] = LATENCY_BUCKETS_SECONDS) -> None:
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._children: dict[tuple[str, ...], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values: str) -> Histogram:
+        child = self._children.get(label_values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_values, Histogram(self.buckets))
+        return child
+
+    def children(self) -> list[tuple[tuple[str, ...], Histogram]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+
+class MetricsRegistry:
+    """Prometheus text exposition (format 0.0.4) for the in-process metrics.
+
+    Hot paths only touch counters and histograms; gauges and counters that
+    other components already keep (cache hits, in-flight requests, breaker
+    state) are read through callbacks at scrape time, so they cost nothing
+    between scrapes.
+    """
+
+    def __init__(self) -> None:
+        self._families: dict[str, tuple[str, str, tuple[str, ...], Callable[[], Iterable[tuple[tuple, Any]]]]] = {}
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        counter = Counter(labelnames)
+        self._families[name] = ("counter", help_text, labelnames, counter.samples)
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = LATENCY_BUCKETS_SECONDS,
+    ) -> HistogramFamily:
+        family = HistogramFamily(labelnames, buckets)
+        self._families[name] = ("histogram", help_text, labelnames, family.children)
+        return family
+
+    def register_histogram(self, name: str, help_text: str, histogram: Histogram) -> None:
+        """Expose an existing unlabelled ``Histogram``."""
+        self._families[name] = ("histogram", help_text, (), lambda: [((), histogram)])
+
+    def callback(
+        self,
+        name: str,
+        metric_type: str,
+        help_text: str,
+        labelnames: tuple[str, ...],
+        collect: Callable[[], Iterable[tuple[tuple, float]]],
+    ) -> None:
+        """Expose values read at scrape time; ``collect`` yields ``(label_values, value)``."""
+        self._families[name] = (metric_type, help_text, labelnames, collect)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for name, (metric_type, help_text, labelnames, collect) in sorted(self._families.items()):
+            try:
+                samples = list(collect())
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for label_values, value in samples:
+                if metric_type == "histogram":
+                    snapshot = value.snapshot()
+                    for bound, cumulative in snapshot["buckets"].items():
+                        labels = _format_labels(labelnames, label_values, f'le="{bound}"')
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(labelnames, label_values)
+                    lines.append(f"{name}_sum{labels} {_format_value(snapshot['sum'])}")
+                    lines.append(f"{name}_count{labels} {snapshot['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labelnames, label_values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_duration = registry.histogram(
+    "ipc_stage_duration_seconds",
+    "Time spent in each prediction pipeline stage.",
+    ("stage",),
+)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Observe the enclosed block's duration under ``stage``, failures included.
+
+    The duration also goes to the current request's trace, if there is one.
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        stage_duration.labels(stage).observe(elapsed)
+        record_stage(stage, elapsed)
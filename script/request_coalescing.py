@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls that share a key onto one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it runs
+    await the same task and receive its result or its exception. The task is
+    shielded, so a cancelled caller (e.g. a disconnected client) does not cancel
+    the computation for the others.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _consume_exception(task: asyncio.Task) -> None:
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            self.leaders += 1
+            task.add_done_callback(self._consume_exception)
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,177 @@
+import contextvars
+import cProfile
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+
+# Requests slower than this are profiled to PROFILE_DIR; 0 disables the profiler.
+PROFILE_SLOW_MS = float(os.getenv("IPC_PROFILE_SLOW_MS", "0"))
+# Share of requests run under the profiler (only one at a time); the profile is
+# kept only when the request turns out slower than PROFILE_SLOW_MS.
+PROFILE_SAMPLE_RATE = float(os.getenv("IPC_PROFILE_SAMPLE_RATE", "0.1"))
+PROFILE_DIR = os.getenv("IPC_PROFILE_DIR", "./profiles")
+# Oldest profiles are deleted beyond this many files.
+PROFILE_MAX_FILES = int(os.getenv("IPC_PROFILE_MAX_FILES", "50"))
+
+
+class RequestTrace:
+    """Per-request stage durations and attributes, filled in as the request runs.
+
+    Stages that run more than once (e.g. a hedged Gemini call) accumulate.
+    """
+
+    def __init__(self, request_id: str | None = None) -> None:
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.started_at = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.attributes: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def server_timing(self) -> str:
+        """``Server-Timing`` header value, durations in milliseconds."""
+        with self._lock:
+            stages = list(self.stages.items())
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_log_record(self) -> dict[str, Any]:
+        with self._lock:
+            stages = {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+        return {
+            "request_id": self.request_id,
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "stages_ms": stages,
+            **self.attributes,
+        }
+
+
+_current_trace: contextvars.ContextVar[RequestTrace | None] = contextvars.ContextVar("ipc_trace", default=None)
+
+
+def current_trace() -> RequestTrace | None:
+    return _current_trace.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record_stage(stage, seconds)
+
+
+def annotate(**attributes: Any) -> None:
+    """Attach attributes (prompt size, candidate count, ...) to the current request's trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+@contextmanager
+def trace_request(request_id: str | None = None) -> Iterator[RequestTrace]:
+    """Collect stage timings for the enclosed work.
+
+    The trace travels in a context variable, so tasks and worker threads
+    started inside the block (including a coalesced prediction's shared task)
+    record into it.
+    """
+    trace = RequestTrace(request_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+class SlowRequestProfiler:
+    """Samples requests under cProfile and keeps the profiles of slow ones.
+
+    A sampled request is profiled from start to finish; if it took at least
+    ``slow_ms`` the stats are dumped to ``directory`` (``.prof``, readable by
+    pstats, snakeviz or flameprof) and the oldest files beyond ``max_files``
+    are removed. Only one request is profiled at a time. On the event loop the
+    profile also contains whatever other requests ran meanwhile.
+    """
+
+    def __init__(
+        self,
+        slow_ms: float = PROFILE_SLOW_MS,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        directory: str | Path = PROFILE_DIR,
+        max_files: int = PROFILE_MAX_FILES,
+    ) -> None:
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.directory = Path(directory)
+        self.max_files = max(1, max_files)
+        self._busy = threading.Lock()
+        self._counter = 0
+        self.profiled = 0
+        self.saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.slow_ms > 0 and self.sample_rate > 0
+
+    def _should_sample(self) -> bool:
+        # Deterministic 1-in-N sampling keeps the overhead predictable.
+        self._counter += 1
+        return self._counter * self.sample_rate >= self.profiled + 1
+
+    @contextmanager
+    def profile(self, trace: RequestTrace) -> Iterator[None]:
+        if not self.enabled or not self._should_sample() or not self._busy.acquire(blocking=False):
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        self.profiled += 1
+        try:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) is already active.
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+            elapsed_ms = trace.elapsed() * 1000
+            if elapsed_ms >= self.slow_ms:
+                self._save(profiler, trace, elapsed_ms)
+        finally:
+            self._busy.release()
+
+    def _save(self, profiler: cProfile.Profile, trace: RequestTrace, elapsed_ms: float) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            name = f"{time.strftime('%Y%m%dT%H%M%S')}_{trace.request_id}_{elapsed_ms:.0f}ms.prof"
+            profiler.dump_stats(str(self.directory / name))
+            self.saved += 1
+            profiles = sorted(self.directory.glob("*.prof"), key=lambda path: path.stat().st_mtime)
+            for stale in profiles[: max(0, len(profiles) - self.max_files)]:
+                stale.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "slow_ms": self.slow_ms,
+            "sample_rate": self.sample_rate,
+            "directory": str(self.directory),
+            "profiled": self.profiled,
+            "saved": self.saved,
+        }
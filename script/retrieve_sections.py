@@ -1,20 +1,84 @@
-import json
+import asyncio
 import os
+import threading
 from pathlib import Path
 from typing import Any
 
 import chromadb
-import requests
+
+try:
+    from script.bulkhead import Bulkhead
+    from script.caching import EmbeddingCache, normalize_query_text
+    from script.circuit_breaker import CircuitBreaker
+    from script.deadlines import remaining_timeout, within_deadline
+    from script.embedding_batcher import EmbeddingMicroBatcher
+    from script.metrics import stage_timer
+    from script.upstream_http import get_upstream_http
+    from script.section_catalog import (
+        SectionCatalog,
+        SectionRecord,
+        _section_sort_key,
+        get_section_catalog,
+    )
+    from script.vector_index import (
+        NUMPY_INDEX_PATH,
+        ChromaVectorIndex,
+        NumpyVectorIndex,
+        VectorIndex,
+        distance_to_similarity,
+    )
+except ImportError:
+    from bulkhead import Bulkhead
+    from caching import EmbeddingCache, normalize_query_text
+    from circuit_breaker import CircuitBreaker
+    from deadlines import remaining_timeout, within_deadline
+    from embedding_batcher import EmbeddingMicroBatcher
+    from metrics import stage_timer
+    from upstream_http import get_upstream_http
+    from section_catalog import SectionCatalog, SectionRecord, _section_sort_key, get_section_catalog
+    from vector_index import NUMPY_INDEX_PATH, ChromaVectorIndex, NumpyVectorIndex, VectorIndex
+    from vector_index import distance_to_similarity
 
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 if not OPENROUTER_API_KEY:
     raise RuntimeError("OPENROUTER_API_KEY environment variable not set")
 MODEL = "openai/text-embedding-3-small"
-OPENROUTER_EMBEDDINGS_URL = "https://openrouter.ai/api/v1/embeddings"
+# The offline benchmarks point this at a local stand-in (benchmarks/stub_upstreams.py).
+OPENROUTER_EMBEDDINGS_URL = os.getenv("IPC_OPENROUTER_EMBEDDINGS_URL", "https://openrouter.ai/api/v1/embeddings")
 PERSIST_DIRECTORY = "./chroma_ipc_v1"
 COLLECTION_NAME = "ipc_sections_v1"
 TOP_K = 7
+# "chroma" queries the persistent collection; "numpy" searches the exported matrix in memory.
+VECTOR_BACKEND = os.getenv("IPC_VECTOR_BACKEND", "chroma")
+# Maximum inputs per embeddings request; the provider accepts arrays of up to 2048.
+EMBEDDING_BATCH_SIZE = int(os.getenv("IPC_EMBEDDING_BATCH_SIZE", "256"))
+# Concurrent API queries are micro-batched into one embeddings request; 0 ms disables batching.
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("IPC_EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+EMBEDDING_BATCH_MAX_SIZE = min(int(os.getenv("IPC_EMBEDDING_BATCH_MAX_SIZE", "64")), EMBEDDING_BATCH_SIZE)
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("IPC_EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("IPC_EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+# Optional SQLite file for a cache tier that survives restarts; unset keeps it memory-only.
+EMBEDDING_CACHE_PATH = os.getenv("IPC_EMBEDDING_CACHE_PATH") or None
+# Embedding calls slower than this count towards opening the OpenRouter breaker.
+EMBEDDING_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("IPC_EMBEDDING_BREAKER_SLOW_CALL_SECONDS", "2"))
+# Per-stage bulkheads on the API path: concurrent calls and how many may wait for a slot.
+# Keep concurrency + queue below IPC_MAX_IN_FLIGHT (64), or admission fills up
+# before a slow stage ever rejects anything.
+EMBEDDING_CONCURRENCY = int(os.getenv("IPC_EMBEDDING_CONCURRENCY", "16"))
+EMBEDDING_QUEUE_SIZE = int(os.getenv("IPC_EMBEDDING_QUEUE_SIZE", "32"))
+VECTOR_CONCURRENCY = int(os.getenv("IPC_VECTOR_CONCURRENCY", "4"))
+VECTOR_QUEUE_SIZE = int(os.getenv("IPC_VECTOR_QUEUE_SIZE", "32"))
+
+embedding_cache = EmbeddingCache(
+    EMBEDDING_CACHE_SIZE,
+    ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+    disk_path=EMBEDDING_CACHE_PATH,
+)
+embedding_breaker = CircuitBreaker("openrouter_embeddings", EMBEDDING_BREAKER_SLOW_CALL_SECONDS)
+embedding_bulkhead = Bulkhead("embedding", EMBEDDING_CONCURRENCY, EMBEDDING_QUEUE_SIZE)
+vector_bulkhead = Bulkhead("vector", VECTOR_CONCURRENCY, VECTOR_QUEUE_SIZE)
 
 
 def _resolve_persist_directory() -> str:
@@ -32,97 +96,407 @@ def _resolve_persist_directory() -> str:
     return str(candidates[0])
 
 
-def _embed_text(text: str) -> list[float]:
-    headers = {
+def _embeddings_headers() -> dict[str, str]:
+    return {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
     }
-    payload = {
-        "model": MODEL,
-        "input": text,
-    }
-    response = requests.post(
-        OPENROUTER_EMBEDDINGS_URL,
-        headers=headers,
-        json=payload,
-        timeout=60,
-    )
-    response.raise_for_status()
-    body = response.json()
-    return body["data"][0]["embedding"]
-
-
-def _section_sort_key(section_number: str) -> tuple[int, str]:
-    section_number = str(section_number).strip()
-    digits = ""
-    suffix = ""
-    for char in section_number:
-        if char.isdigit() and suffix == "":
-            digits += char
+
+
+def _parse_embeddings(body: dict[str, Any], expected: int) -> list[list[float]]:
+    data = sorted(body["data"], key=lambda item: item.get("index", 0))
+    if len(data) != expected:
+        raise ValueError(f"Expected {expected} embeddings, got {len(data)}")
+    return [item["embedding"] for item in data]
+
+
+def _request_embeddings(texts: list[str], timeout: float | None = None) -> list[list[float]]:
+    with embedding_breaker.guard(), stage_timer("embedding"):
+        response = get_upstream_http().post(
+            OPENROUTER_EMBEDDINGS_URL,
+            headers=_embeddings_headers(),
+            json={"model": MODEL, "input": texts},
+            timeout=timeout,
+        )
+        response.raise_for_status()
+    return _parse_embeddings(response.json(), len(texts))
+
+
+def _request_embedding(text: str, timeout: float | None = None) -> list[float]:
+    return _request_embeddings([text], timeout)[0]
+
+
+async def _arequest_embeddings(texts: list[str], timeout: float | None = None) -> list[list[float]]:
+    async with embedding_bulkhead.slot():
+        with embedding_breaker.guard(), stage_timer("embedding"):
+            response = await get_upstream_http().apost(
+                OPENROUTER_EMBEDDINGS_URL,
+                headers=_embeddings_headers(),
+                json={"model": MODEL, "input": texts},
+                timeout=timeout,
+            )
+            response.raise_for_status()
+    return _parse_embeddings(response.json(), len(texts))
+
+
+def _embed_text(text: str) -> list[float]:
+    normalized = normalize_query_text(text)
+    cached = embedding_cache.get(normalized, MODEL)
+    if cached is not None:
+        return cached
+
+    embedding = _request_embedding(normalized, remaining_timeout())
+    embedding_cache.put(normalized, MODEL, embedding)
+    return embedding
+
+
+embedding_batcher = EmbeddingMicroBatcher(
+    _arequest_embeddings,
+    max_batch=EMBEDDING_BATCH_MAX_SIZE,
+    max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
+)
+
+
+async def _aembed_text(text: str) -> list[float]:
+    normalized = normalize_query_text(text)
+    cached = await embedding_cache.aget(normalized, MODEL)
+    if cached is not None:
+        return cached
+
+    # A shared batch request runs with the client timeout; each caller stops
+    # waiting for it when its own deadline passes.
+    if EMBEDDING_BATCH_MAX_WAIT_MS > 0:
+        embedding = await within_deadline(embedding_batcher.embed(normalized))
+    else:
+        embedding = (await within_deadline(_arequest_embeddings([normalized], remaining_timeout())))[0]
+    embedding_cache.put_behind([(normalized, embedding)], MODEL)
+    return embedding
+
+
+def _embed_texts(texts: list[str]) -> list[list[float]]:
+    normalized_texts = [normalize_query_text(text) for text in texts]
+    embeddings: dict[str, list[float]] = {}
+    pending: list[str] = []
+    for normalized in dict.fromkeys(normalized_texts):
+        cached = embedding_cache.get(normalized, MODEL)
+        if cached is not None:
+            embeddings[normalized] = cached
         else:
-            suffix += char
-    numeric_part = int(digits) if digits else 0
-    return numeric_part, suffix
+            pending.append(normalized)
+
+    for start in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+        chunk = pending[start:start + EMBEDDING_BATCH_SIZE]
+        for normalized, embedding in zip(chunk, _request_embeddings(chunk)):
+            embedding_cache.put(normalized, MODEL, embedding)
+            embeddings[normalized] = embedding
+
+    return [embeddings[normalized] for normalized in normalized_texts]
 
 
-def _normalize_keywords(value: Any) -> Any:
-    if isinstance(value, str):
+async def _aembed_texts(texts: list[str]) -> list[list[float]]:
+    normalized_texts = [normalize_query_text(text) for text in texts]
+    unique_texts = list(dict.fromkeys(normalized_texts))
+    embeddings: dict[str, list[float]] = {}
+    pending: list[str] = []
+    for normalized, cached in zip(unique_texts, await embedding_cache.aget_many(unique_texts, MODEL)):
+        if cached is not None:
+            embeddings[normalized] = cached
+        else:
+            pending.append(normalized)
+
+    chunks = [
+        pending[start:start + EMBEDDING_BATCH_SIZE]
+        for start in range(0, len(pending), EMBEDDING_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(*(_arequest_embeddings(chunk) for chunk in chunks))
+    for chunk, chunk_embeddings in zip(chunks, results):
+        embedding_cache.put_behind(list(zip(chunk, chunk_embeddings)), MODEL)
+        embeddings.update(zip(chunk, chunk_embeddings))
+
+    return [embeddings[normalized] for normalized in normalized_texts]
+
+
+def _query_index(index: VectorIndex, query_embedding: list[float], top_k: int) -> tuple[list[str], list[float]]:
+    with stage_timer("vector_query"):
+        return index.query(query_embedding, top_k)
+
+
+def _query_index_batch(
+    index: VectorIndex,
+    query_embeddings: list[list[float]],
+    top_k: int,
+) -> list[tuple[list[str], list[float]]]:
+    with stage_timer("vector_query"):
+        return index.query_batch(query_embeddings, top_k)
+
+
+class RetrievalEngine:
+    """Owns the vector index and section catalog for the lifetime of the process.
+
+    Opening resolves the store and loads the index once, so a retrieval
+    afterwards costs one embedding call and one vector query. The index only
+    returns IDs and distances; section content comes from the catalog.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str | None = None,
+        collection_name: str = COLLECTION_NAME,
+        backend: str = VECTOR_BACKEND,
+        index_path: str | Path = NUMPY_INDEX_PATH,
+        catalog: SectionCatalog | None = None,
+    ) -> None:
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vector backend: {backend}")
+        self._persist_directory = persist_directory
+        self._collection_name = collection_name
+        self._backend = backend
+        self._index_path = index_path
+        self._catalog = catalog
+        self._client: Any = None
+        self._index: VectorIndex | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._index is not None
+
+    def open(self) -> None:
+        with self._lock:
+            if self._index is not None:
+                return
+            if self._catalog is None:
+                self._catalog = get_section_catalog()
+            if self._backend == "numpy":
+                index = NumpyVectorIndex.load(self._index_path)
+                client = None
+            else:
+                persist_directory = self._persist_directory or _resolve_persist_directory()
+                client = chromadb.PersistentClient(path=persist_directory)
+                collection = client.get_collection(name=self._collection_name)
+                self._persist_directory = persist_directory
+                index = ChromaVectorIndex(collection)
+
+            missing = [section_id for section_id in index.ids() if section_id not in self._catalog]
+            if missing:
+                raise ValueError(f"Vector index has {len(missing)} IDs missing from the section catalog")
+            self._client = client
+            self._index = index
+
+    def close(self) -> None:
+        with self._lock:
+            client = self._client
+            index = self._index
+            self._client = None
+            self._index = None
+        if index is not None:
+            index.close()
+        close_client = getattr(client, "close", None)
+        if close_client is not None:
+            close_client()
+
+    def index(self) -> VectorIndex:
+        index = self._index
+        if index is None:
+            self.open()
+            index = self._index
+        return index
+
+    def catalog(self) -> SectionCatalog:
+        if self._catalog is None:
+            self.open()
+        return self._catalog
+
+    def health(self) -> dict[str, Any]:
         try:
-            parsed = json.loads(value)
-            if isinstance(parsed, list):
-                return parsed
-        except json.JSONDecodeError:
-            return value
-    return value
+            index = self.index()
+            count = index.count()
+        except Exception as exc:
+            return {
+                "status": "error",
+                "backend": self._backend,
+                "collection": self._collection_name,
+                "error": type(exc).__name__,
+            }
+        return {
+            "status": "ok",
+            "backend": self._backend,
+            "collection": self._collection_name,
+            "persist_directory": self._persist_directory,
+            "space": index.space,
+            "count": count,
+        }
+
+    def _default_rows(self, top_k: int = TOP_K) -> list[tuple[dict[str, Any], float]]:
+        return [(record.as_result(), 0.0) for record in self.catalog().ordered[:top_k]]
+
+    def _rank_rows(
+        self,
+        ids: list[str],
+        distances: list[float],
+        top_k: int = TOP_K,
+    ) -> list[tuple[dict[str, Any], float]]:
+        catalog = self.catalog()
+        space = self.index().space
+        scored: list[tuple[SectionRecord, float]] = []
+        for section_id, distance in zip(ids, distances):
+            record = catalog.get(section_id)
+            if record is not None:
+                scored.append((record, distance_to_similarity(float(distance), space)))
+
+        scored.sort(key=lambda row: (-row[1], row[0].sort_key))
+        return [(record.as_result(), similarity) for record, similarity in scored[:top_k]]
+
+    def retrieve_with_embedding(
+        self,
+        incident_text: str,
+        top_k: int = TOP_K,
+    ) -> tuple[list[tuple[dict[str, Any], float]], list[float] | None]:
+        index = self.index()
+
+        if incident_text.strip() == "":
+            return self._default_rows(top_k), None
+
+        query_embedding = _embed_text(incident_text)
+        ids, distances = _query_index(index, query_embedding, top_k)
+        return self._rank_rows(ids, distances, top_k), query_embedding
+
+    def retrieve_with_scores(
+        self,
+        incident_text: str,
+        top_k: int = TOP_K,
+    ) -> list[tuple[dict[str, Any], float]]:
+        return self.retrieve_with_embedding(incident_text, top_k)[0]
+
+    async def aretrieve_with_embedding(
+        self,
+        incident_text: str,
+        top_k: int = TOP_K,
+    ) -> tuple[list[tuple[dict[str, Any], float]], list[float] | None]:
+        index = self.index()
+
+        if incident_text.strip() == "":
+            return self._default_rows(top_k), None
+
+        query_embedding = await _aembed_text(incident_text)
+        if index.blocking:
+            ids, distances = await within_deadline(
+                vector_bulkhead.run_in_thread(_query_index, index, query_embedding, top_k)
+            )
+        else:
+            ids, distances = _query_index(index, query_embedding, top_k)
+        return self._rank_rows(ids, distances, top_k), query_embedding
+
+    async def aretrieve_with_scores(
+        self,
+        incident_text: str,
+        top_k: int = TOP_K,
+    ) -> list[tuple[dict[str, Any], float]]:
+        return (await self.aretrieve_with_embedding(incident_text, top_k))[0]
+
+    async def aretrieve_with_embedding_batch(
+        self,
+        incident_texts: list[str],
+        top_k: int = TOP_K,
+    ) -> list[tuple[list[tuple[dict[str, Any], float]], list[float] | None]]:
+        index = self.index()
+
+        query_positions = [i for i, text in enumerate(incident_texts) if text.strip() != ""]
+        query_embeddings = await _aembed_texts([incident_texts[i] for i in query_positions])
+        if index.blocking:
+            query_results = await vector_bulkhead.run_in_thread(_query_index_batch, index, query_embeddings, top_k)
+        else:
+            query_results = _query_index_batch(index, query_embeddings, top_k)
 
+        rows: list[tuple[list[tuple[dict[str, Any], float]], list[float] | None]] = [
+            (self._default_rows(top_k), None) for _ in incident_texts
+        ]
+        for position, embedding, (ids, distances) in zip(query_positions, query_embeddings, query_results):
+            rows[position] = (self._rank_rows(ids, distances, top_k), embedding)
+        return rows
 
-def _format_result(metadata: dict[str, Any]) -> dict[str, Any]:
-    return {
-        "section_number": str(metadata.get("section_number", "")),
-        "title": metadata.get("title", ""),
-        "summary": metadata.get("summary", ""),
-        "keywords": _normalize_keywords(metadata.get("keywords", [])),
-        "full_text": metadata.get("full_text", ""),
-        "offence_type": metadata.get("offence_type", ""),
-    }
+    def retrieve_with_scores_batch(
+        self,
+        incident_texts: list[str],
+        top_k: int = TOP_K,
+    ) -> list[list[tuple[dict[str, Any], float]]]:
+        index = self.index()
 
+        query_positions = [i for i, text in enumerate(incident_texts) if text.strip() != ""]
+        query_embeddings = _embed_texts([incident_texts[i] for i in query_positions])
+        query_results = _query_index_batch(index, query_embeddings, top_k)
 
-def _retrieve_with_scores(incident_text: str) -> list[tuple[dict[str, Any], float]]:
-    client = chromadb.PersistentClient(path=_resolve_persist_directory())
-    collection = client.get_collection(name=COLLECTION_NAME)
+        ranked: list[list[tuple[dict[str, Any], float]]] = [[] for _ in incident_texts]
+        for position, (ids, distances) in zip(query_positions, query_results):
+            ranked[position] = self._rank_rows(ids, distances, top_k)
 
-    if incident_text.strip() == "":
-        all_rows = collection.get(include=["metadatas"])
-        metadatas = all_rows.get("metadatas", [])
-        ordered = sorted(
-            metadatas,
-            key=lambda row: _section_sort_key(str(row.get("section_number", ""))),
-        )
-        top_rows = ordered[:TOP_K]
-        return [(_format_result(row), 0.0) for row in top_rows]
-
-    query_embedding = _embed_text(incident_text)
-    query_result = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=TOP_K,
-        include=["embeddings", "metadatas", "distances"],
-    )
+        for position, text in enumerate(incident_texts):
+            if text.strip() == "":
+                ranked[position] = self._default_rows(top_k)
+        return ranked
 
-    metadatas = query_result["metadatas"][0]
-    distances = query_result["distances"][0]
 
-    rows: list[tuple[dict[str, Any], float]] = []
-    for metadata, distance in zip(metadatas, distances):
-        similarity = 1.0 - float(distance)
-        rows.append((_format_result(metadata), similarity))
+_engine: RetrievalEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_retrieval_engine() -> RetrievalEngine:
+    global _engine
+    engine = _engine
+    if engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+            engine = _engine
+    return engine
+
+
+def _retrieve_with_scores(
+    incident_text: str,
+    engine: RetrievalEngine | None = None,
+    top_k: int = TOP_K,
+) -> list[tuple[dict[str, Any], float]]:
+    return (engine or get_retrieval_engine()).retrieve_with_scores(incident_text, top_k)
 
-    rows.sort(
-        key=lambda row: (
-            -row[1],
-            _section_sort_key(str(row[0].get("section_number", ""))),
-        )
-    )
-    return rows[:TOP_K]
+
+def _retrieve_with_embedding(
+    incident_text: str,
+    engine: RetrievalEngine | None = None,
+    top_k: int = TOP_K,
+) -> tuple[list[tuple[dict[str, Any], float]], list[float] | None]:
+    return (engine or get_retrieval_engine()).retrieve_with_embedding(incident_text, top_k)
+
+
+async def _aretrieve_with_embedding(
+    incident_text: str,
+    engine: RetrievalEngine | None = None,
+    top_k: int = TOP_K,
+) -> tuple[list[tuple[dict[str, Any], float]], list[float] | None]:
+    return await (engine or get_retrieval_engine()).aretrieve_with_embedding(incident_text, top_k)
+
+
+async def _aretrieve_with_scores(
+    incident_text: str,
+    engine: RetrievalEngine | None = None,
+    top_k: int = TOP_K,
+) -> list[tuple[dict[str, Any], float]]:
+    return await (engine or get_retrieval_engine()).aretrieve_with_scores(incident_text, top_k)
+
+
+async def _aretrieve_with_embedding_batch(
+    incident_texts: list[str],
+    engine: RetrievalEngine | None = None,
+    top_k: int = TOP_K,
+) -> list[tuple[list[tuple[dict[str, Any], float]], list[float] | None]]:
+    return await (engine or get_retrieval_engine()).aretrieve_with_embedding_batch(incident_texts, top_k)
+
+
+def _retrieve_with_scores_batch(
+    incident_texts: list[str],
+    engine: RetrievalEngine | None = None,
+    top_k: int = TOP_K,
+) -> list[list[tuple[dict[str, Any], float]]]:
+    return (engine or get_retrieval_engine()).retrieve_with_scores_batch(incident_texts, top_k)
 
 
 def retrieve_sections(incident_text: str) -> list[dict]:
@@ -130,6 +504,13 @@ def retrieve_sections(incident_text: str) -> list[dict]:
     return [item for item, _ in ranked]
 
 
+def retrieve_sections_batch(incident_texts: list[str]) -> list[list[dict]]:
+    return [
+        [item for item, _ in ranked]
+        for ranked in _retrieve_with_scores_batch(incident_texts)
+    ]
+
+
 def _test_determinism() -> None:
     deterministic_query = (
         "A person entered another person's home at night and stole cash and jewelry."
@@ -151,8 +532,7 @@ def _test_edge_cases() -> None:
         "1234567890 987654321",
     ]
 
-    for case in edge_cases:
-        ranked = _retrieve_with_scores(case)
+    for ranked in _retrieve_with_scores_batch(edge_cases):
         assert len(ranked) == TOP_K, f"Output length is not {TOP_K}"
         print("Top 5 sections:")
         print([row[0]["section_number"] for row in ranked])
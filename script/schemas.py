@@ -1,5 +1,17 @@
 from pydantic import BaseModel, Field
 
 
+BATCH_MAX_ITEMS = 500
+
+
 class CaseInput(BaseModel):
     text: str = Field(..., min_length=7)
+
+
+class BatchCaseItem(BaseModel):
+    # No min_length: a short item gets its own insufficient_input result instead of failing the batch.
+    text: str
+
+
+class BatchCaseInput(BaseModel):
+    cases: list[BatchCaseItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
@@ -0,0 +1,115 @@
+import json
+import threading
+from pathlib import Path
+from typing import Any
+
+
+DATASET_PATH = Path(__file__).resolve().parent.parent / "data" / "ipc_enriched_v1.json"
+
+
+def _section_sort_key(section_number: str) -> tuple[int, str]:
+    section_number = str(section_number).strip()
+    digits = ""
+    suffix = ""
+    for char in section_number:
+        if char.isdigit() and suffix == "":
+            digits += char
+        else:
+            suffix += char
+    numeric_part = int(digits) if digits else 0
+    return numeric_part, suffix
+
+
+def _parse_keywords(value: Any) -> tuple[str, ...] | str:
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+        except json.JSONDecodeError:
+            return value
+        if isinstance(parsed, list):
+            value = parsed
+        else:
+            return value
+    if isinstance(value, (list, tuple)):
+        return tuple(str(item) for item in value)
+    return str(value)
+
+
+class SectionRecord:
+    __slots__ = (
+        "section_number",
+        "title",
+        "summary",
+        "keywords",
+        "full_text",
+        "offence_type",
+        "sort_key",
+    )
+
+    def __init__(self, item: dict[str, Any]) -> None:
+        self.section_number = str(item.get("section_number", "")).strip()
+        self.title = str(item.get("title", ""))
+        self.summary = str(item.get("summary", ""))
+        self.keywords = _parse_keywords(item.get("keywords", []))
+        self.full_text = str(item.get("full_text", ""))
+        self.offence_type = str(item.get("offence_type", ""))
+        self.sort_key = _section_sort_key(self.section_number)
+
+    def as_result(self) -> dict[str, Any]:
+        keywords = self.keywords
+        return {
+            "section_number": self.section_number,
+            "title": self.title,
+            "summary": self.summary,
+            "keywords": list(keywords) if isinstance(keywords, tuple) else keywords,
+            "full_text": self.full_text,
+            "offence_type": self.offence_type,
+        }
+
+
+class SectionCatalog:
+    """Read-only view of the enriched dataset, loaded once per process.
+
+    Records are kept in canonical section order and indexed by section number,
+    so the vector store only has to return IDs and distances.
+    """
+
+    def __init__(self, records: list[SectionRecord]) -> None:
+        self._ordered = tuple(sorted(records, key=lambda record: record.sort_key))
+        self._by_number = {record.section_number: record for record in self._ordered}
+        if len(self._by_number) != len(self._ordered):
+            raise ValueError("Duplicate section numbers in catalog")
+
+    @classmethod
+    def load(cls, path: str | Path = DATASET_PATH) -> "SectionCatalog":
+        with Path(path).open("r", encoding="utf-8") as file:
+            dataset = json.load(file)
+        return cls([SectionRecord(item) for item in dataset])
+
+    @property
+    def ordered(self) -> tuple[SectionRecord, ...]:
+        return self._ordered
+
+    def get(self, section_number: str) -> SectionRecord | None:
+        return self._by_number.get(str(section_number).strip())
+
+    def __contains__(self, section_number: object) -> bool:
+        return str(section_number).strip() in self._by_number
+
+    def __len__(self) -> int:
+        return len(self._ordered)
+
+
+_catalog: SectionCatalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def get_section_catalog() -> SectionCatalog:
+    global _catalog
+    catalog = _catalog
+    if catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = SectionCatalog.load()
+            catalog = _catalog
+    return catalog
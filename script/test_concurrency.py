@@ -0,0 +1,409 @@
+"""
+Concurrency primitives used on the API path.
+
+Runs offline: nothing here imports the pipeline modules or needs API keys.
+
+Usage:
+    python -m script.test_concurrency
+"""
+
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    from script.admission_control import AdmissionController, Overloaded
+    from script.bulkhead import Bulkhead, BulkheadFull
+    from script.caching import EmbeddingCache
+    from script.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError
+    from script.embedding_batcher import EmbeddingMicroBatcher
+    from script.request_coalescing import SingleFlight
+except ImportError:
+    from admission_control import AdmissionController, Overloaded
+    from bulkhead import Bulkhead, BulkheadFull
+    from caching import EmbeddingCache
+    from circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError
+    from embedding_batcher import EmbeddingMicroBatcher
+    from request_coalescing import SingleFlight
+
+PASS = "PASS"
+FAIL = "FAIL"
+
+results: list[tuple[str, str, str]] = []  # (category, test_name, status)
+
+
+def record(category: str, name: str, passed: bool, detail: str = ""):
+    status = PASS if passed else FAIL
+    results.append((category, name, status))
+    mark = "+" if passed else "X"
+    msg = f"  [{mark}] {name}"
+    if detail and not passed:
+        msg += f"  -- {detail}"
+    print(msg)
+
+
+async def _until(condition, timeout: float = 1.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0)
+    return True
+
+
+# ===================================================================
+# ADMISSION CONTROL
+# ===================================================================
+async def _admission_cancel_race(yields: int) -> tuple[str, AdmissionController]:
+    # A queued request is cancelled while the running one finishes: release()
+    # may pop the already-cancelled waiter before acquire() cleans it up.
+    admission = AdmissionController(max_in_flight=1, max_queue=4, max_queue_seconds=5)
+    await admission.acquire()
+    waiting = asyncio.ensure_future(admission.acquire())
+    await _until(lambda: len(admission._waiters) == 1)
+
+    waiting.cancel()
+    for _ in range(yields):
+        await asyncio.sleep(0)
+    admission.release()
+    try:
+        await waiting
+    except asyncio.CancelledError:
+        return "cancelled", admission
+    except Exception as exc:
+        return f"{type(exc).__name__}: {exc}", admission
+    # The slot was handed over before the cancellation landed; give it back.
+    admission.release()
+    return "admitted", admission
+
+
+async def _admission_timeout_race() -> tuple[str, AdmissionController]:
+    # The queue timeout fires, and a slot is released before the timed-out
+    # request has removed its (cancelled) waiter.
+    admission = AdmissionController(max_in_flight=1, max_queue=4, max_queue_seconds=0.05)
+    await admission.acquire()
+    waiting = asyncio.ensure_future(admission.acquire())
+    await _until(lambda: len(admission._waiters) == 1)
+
+    released = await _until(
+        lambda: waiting.done() or (bool(admission._waiters) and admission._waiters[0].cancelled()),
+        timeout=2.0,
+    )
+    released = released and not waiting.done()
+    if released:
+        admission.release()
+    try:
+        await waiting
+        outcome = "admitted"
+    except Overloaded as exc:
+        outcome = f"{exc.reason}/{exc.status_code}"
+    except Exception as exc:
+        outcome = f"{type(exc).__name__}: {exc}"
+    if not released:
+        admission.release()
+    return outcome, admission
+
+
+async def _admission_queue_full() -> tuple[int | None, AdmissionController]:
+    admission = AdmissionController(max_in_flight=1, max_queue=1, max_queue_seconds=5)
+    await admission.acquire()
+    waiting = asyncio.ensure_future(admission.acquire())
+    await _until(lambda: len(admission._waiters) == 1)
+    status = None
+    try:
+        await admission.acquire()
+    except Overloaded as exc:
+        status = exc.status_code
+    admission.release()
+    await waiting
+    admission.release()
+    return status, admission
+
+
+def test_admission():
+    print("\n=== ADMISSION CONTROL ===")
+    for yields in (0, 1, 2, 3):
+        outcome, admission = asyncio.run(_admission_cancel_race(yields))
+        record(
+            "ADMISSION",
+            f"Cancel while a slot is released ({yields} yields) -> cancelled or admitted",
+            outcome in ("cancelled", "admitted"),
+            outcome,
+        )
+        record(
+            "ADMISSION",
+            f"No leaked slot or waiter ({yields} yields)",
+            admission.in_flight == 0 and not admission._waiters,
+            f"in_flight={admission.in_flight}, waiters={len(admission._waiters)}",
+        )
+
+    outcome, admission = asyncio.run(_admission_timeout_race())
+    record(
+        "ADMISSION",
+        "Timeout while a slot is released -> 503 queue_timeout",
+        outcome == "queue_timeout/503",
+        outcome,
+    )
+    record(
+        "ADMISSION",
+        "Timeout counted, no leaked slot or waiter",
+        admission.rejected_queue_timeout == 1 and admission.in_flight == 0 and not admission._waiters,
+        str(admission.stats()),
+    )
+
+    status, admission = asyncio.run(_admission_queue_full())
+    record("ADMISSION", "Full queue -> 429", status == 429, f"status={status}")
+    record("ADMISSION", "Queue-full rejection counted", admission.rejected_queue_full == 1, str(admission.stats()))
+
+
+# ===================================================================
+# BULKHEAD
+# ===================================================================
+async def _bulkhead_saturation() -> tuple[bool, Bulkhead]:
+    bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1)
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with bulkhead.slot():
+            await release.wait()
+
+    running = asyncio.ensure_future(hold())
+    queued = asyncio.ensure_future(hold())
+    await _until(lambda: bulkhead.active == 1 and bulkhead.queued == 1)
+    rejected = False
+    try:
+        async with bulkhead.slot():
+            pass
+    except BulkheadFull:
+        rejected = True
+    release.set()
+    await asyncio.gather(running, queued)
+    return rejected, bulkhead
+
+
+def test_bulkhead():
+    print("\n=== BULKHEAD ===")
+    rejected, bulkhead = asyncio.run(_bulkhead_saturation())
+    record("BULKHEAD", "Full slot + full queue -> BulkheadFull", rejected)
+    record(
+        "BULKHEAD",
+        "Queued caller still completes",
+        bulkhead.completed == 2 and bulkhead.rejected == 1 and bulkhead.active == 0,
+        str({key: bulkhead.stats()[key] for key in ("active", "queued", "completed", "rejected")}),
+    )
+
+
+# ===================================================================
+# CIRCUIT BREAKER
+# ===================================================================
+def _fail(breaker: CircuitBreaker) -> None:
+    try:
+        with breaker.guard():
+            raise RuntimeError("upstream down")
+    except RuntimeError:
+        pass
+
+
+def test_circuit_breaker():
+    print("\n=== CIRCUIT BREAKER ===")
+    breaker = CircuitBreaker("test", slow_call_seconds=10, window=4, min_calls=4, failure_rate=0.5, open_seconds=0.05)
+    for _ in range(4):
+        _fail(breaker)
+    record("BREAKER", "Opens at the failure rate", breaker.state == STATE_OPEN, breaker.state)
+
+    rejected = False
+    try:
+        with breaker.guard():
+            pass
+    except CircuitOpenError:
+        rejected = True
+    record("BREAKER", "Open breaker rejects without calling", rejected and breaker.rejected == 1)
+
+    time.sleep(0.06)
+    record("BREAKER", "Half-open after open_seconds", breaker.state == STATE_HALF_OPEN, breaker.state)
+    probe_blocked = False
+    with breaker.guard():
+        try:
+            with breaker.guard():
+                pass
+        except CircuitOpenError:
+            probe_blocked = True
+    record("BREAKER", "Only one probe while half-open", probe_blocked)
+    record("BREAKER", "Successful probe closes", breaker.state == STATE_CLOSED, breaker.state)
+
+    for _ in range(4):
+        _fail(breaker)
+    time.sleep(0.06)
+    _fail(breaker)
+    record("BREAKER", "Failed probe reopens", breaker.state == STATE_OPEN and breaker.trips == 3, str(breaker.stats()))
+
+
+# ===================================================================
+# SINGLE-FLIGHT COALESCING
+# ===================================================================
+async def _single_flight() -> tuple[list, int, SingleFlight, bool]:
+    flights = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work() -> str:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "verdict"
+
+    callers = [asyncio.ensure_future(flights.run("key", work)) for _ in range(5)]
+    await _until(lambda: flights.stats()["coalesced"] == 4)
+    callers[0].cancel()
+    release.set()
+    outcomes = await asyncio.gather(*callers, return_exceptions=True)
+    return outcomes, calls, flights, isinstance(outcomes[0], asyncio.CancelledError)
+
+
+def test_single_flight():
+    print("\n=== SINGLE-FLIGHT ===")
+    outcomes, calls, flights, first_cancelled = asyncio.run(_single_flight())
+    record("SINGLEFLIGHT", "Identical concurrent calls run once", calls == 1, f"calls={calls}")
+    record(
+        "SINGLEFLIGHT",
+        "Cancelled caller does not cancel the others",
+        outcomes[1:] == ["verdict"] * 4,
+        str(outcomes),
+    )
+    record("SINGLEFLIGHT", "Cancelled caller sees CancelledError", first_cancelled)
+    record("SINGLEFLIGHT", "Key forgotten once done", flights.stats()["in_flight"] == 0, str(flights.stats()))
+
+
+# ===================================================================
+# EMBEDDING MICRO-BATCHER
+# ===================================================================
+async def _micro_batch(fail: bool) -> tuple[list, list[list[str]]]:
+    requests: list[list[str]] = []
+
+    async def request_embeddings(texts: list[str]) -> list[list[float]]:
+        requests.append(texts)
+        if fail:
+            raise RuntimeError("upstream down")
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingMicroBatcher(request_embeddings, max_batch=8, max_wait_ms=5)
+    texts = ["a", "bb", "a", "ccc", "dddd"]
+    outcomes = await asyncio.gather(*(batcher.embed(text) for text in texts), return_exceptions=True)
+    return outcomes, requests
+
+
+async def _micro_batch_cancelled() -> tuple[int, bool]:
+    started = asyncio.Event()
+
+    async def request_embeddings(texts: list[str]) -> list[list[float]]:
+        started.set()
+        await asyncio.Event().wait()
+        return []
+
+    batcher = EmbeddingMicroBatcher(request_embeddings, max_batch=8, max_wait_ms=1)
+    callers = [asyncio.ensure_future(batcher.embed(text)) for text in ("a", "bb")]
+    await started.wait()
+    for task in list(batcher._tasks):
+        task.cancel()
+    done, pending = await asyncio.wait(callers, timeout=1.0)
+    for caller in pending:
+        caller.cancel()
+    return len(pending), all(caller.cancelled() for caller in done)
+
+
+def test_embedding_batcher():
+    print("\n=== EMBEDDING MICRO-BATCHER ===")
+    outcomes, requests = asyncio.run(_micro_batch(fail=False))
+    record("BATCHER", "Concurrent texts share one request", len(requests) == 1, f"requests={requests}")
+    record("BATCHER", "Duplicate texts sent once", requests[:1] == [["a", "bb", "ccc", "dddd"]], f"requests={requests}")
+    record("BATCHER", "Each caller gets its own vector", outcomes == [[1.0], [2.0], [1.0], [3.0], [4.0]], str(outcomes))
+
+    outcomes, _ = asyncio.run(_micro_batch(fail=True))
+    record(
+        "BATCHER",
+        "A failed request fails every caller in it",
+        all(isinstance(outcome, RuntimeError) for outcome in outcomes),
+        str(outcomes),
+    )
+
+    still_waiting, cancelled = asyncio.run(_micro_batch_cancelled())
+    record(
+        "BATCHER",
+        "A cancelled request cancels its callers instead of leaving them waiting",
+        still_waiting == 0 and cancelled,
+        f"still_waiting={still_waiting}",
+    )
+
+
+# ===================================================================
+# EMBEDDING CACHE (ASYNC DISK TIER)
+# ===================================================================
+def _track_disk_threads(cache: EmbeddingCache, seen: set[int]) -> None:
+    for name in ("_disk_get_many", "_disk_put_many"):
+        original = getattr(cache, name)
+
+        def tracked(*args, _original=original):
+            seen.add(threading.get_ident())
+            return _original(*args)
+
+        setattr(cache, name, tracked)
+
+
+async def _embedding_cache_roundtrip(disk_path: str) -> tuple[list, list, dict, set[int], int]:
+    loop_thread = threading.get_ident()
+    seen: set[int] = set()
+    writer = EmbeddingCache(8, disk_path=disk_path)
+    _track_disk_threads(writer, seen)
+    writer.put_behind([("theft of a phone", [1.0, 2.0]), ("cheating", [3.0])], "model")
+    in_memory = await writer.aget_many(["theft of a phone", "cheating", "unknown"], "model")
+    writer.close()
+
+    reader = EmbeddingCache(8, disk_path=disk_path)
+    _track_disk_threads(reader, seen)
+    from_disk = await reader.aget_many(["cheating", "theft of a phone", "unknown"], "model")
+    stats = reader.stats()
+    reader.close()
+    return in_memory, from_disk, stats, seen, loop_thread
+
+
+def test_embedding_cache():
+    print("\n=== EMBEDDING CACHE ===")
+    with tempfile.TemporaryDirectory() as directory:
+        disk_path = str(Path(directory) / "embeddings.sqlite3")
+        in_memory, from_disk, stats, seen, loop_thread = asyncio.run(_embedding_cache_roundtrip(disk_path))
+    record(
+        "EMBCACHE",
+        "Write-behind entries are served from memory",
+        in_memory == [[1.0, 2.0], [3.0], None],
+        str(in_memory),
+    )
+    record("EMBCACHE", "close() flushes queued writes to disk", from_disk == [[3.0], [1.0, 2.0], None], str(from_disk))
+    record("EMBCACHE", "Disk hits counted", stats["disk_hits"] == 2 and stats["disk_write_errors"] == 0, str(stats))
+    record(
+        "EMBCACHE",
+        "SQLite never runs on the event loop thread",
+        bool(seen) and loop_thread not in seen,
+        f"loop={loop_thread}, disk threads={seen}",
+    )
+
+
+def main():
+    test_admission()
+    test_bulkhead()
+    test_circuit_breaker()
+    test_single_flight()
+    test_embedding_batcher()
+    test_embedding_cache()
+
+    failed = [result for result in results if result[2] == FAIL]
+    print(f"\n{len(results) - len(failed)}/{len(results)} checks passed")
+    for category, name, _ in failed:
+        print(f"  FAIL [{category}] {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import json
 import os
-import requests
 import re
 from pathlib import Path
 from jsonschema import Draft202012Validator
 
+from upstream_http import get_upstream_http
+
 # =========================
 # CONFIG
 # =========================
@@ -180,11 +181,10 @@ Return ONLY the JSON object."""
         "max_tokens": 1200
     }
 
-    response = requests.post(
+    response = get_upstream_http().post(
         "https://openrouter.ai/api/v1/chat/completions",
         headers=HEADERS,
         json=payload,
-        timeout=60
     )
     response.raise_for_status()
     return response.json()
@@ -0,0 +1,259 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from script.metrics import registry
+except ImportError:
+    from metrics import registry
+
+
+HTTP_POOL_SIZE = int(os.getenv("IPC_HTTP_POOL_SIZE", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("IPC_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("IPC_HTTP_READ_TIMEOUT", "60"))
+# Requires the h2 package (httpx[http2]); silently stays on HTTP/1.1 otherwise.
+HTTP2_ENABLED = os.getenv("IPC_HTTP2", "0") == "1"
+HTTP_WARM_CONNECTIONS = int(os.getenv("IPC_HTTP_WARM_CONNECTIONS", "2"))
+
+
+upstream_responses = registry.counter(
+    "ipc_upstream_responses_total",
+    "Upstream HTTP responses by host and status code; status is \"error\" when no response arrived.",
+    ("upstream", "status"),
+)
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class UpstreamHTTP:
+    """Per-host keep-alive connection pools shared by every upstream call.
+
+    One client is created per origin, so embedding and LLM traffic never compete
+    for the same pool and each request reuses an already-negotiated TLS session.
+    Sync callers (scripts) get requests sessions; the async API path gets
+    ``httpx.AsyncClient`` instances from the same configuration.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        http2: bool = HTTP2_ENABLED,
+    ) -> None:
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        self._clients: dict[str, Any] = {}
+        self._async_clients: dict[str, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+        )
+
+    def _create_client(self) -> Any:
+        if self.http2:
+            try:
+                return httpx.Client(
+                    http2=True,
+                    limits=self._limits(),
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                )
+            except ImportError:
+                self.http2 = False
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def client_for(self, url: str) -> Any:
+        origin = _origin(url)
+        client = self._clients.get(origin)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(origin)
+                if client is None:
+                    client = self._create_client()
+                    self._clients[origin] = client
+        return client
+
+    def _create_async_client(self) -> httpx.AsyncClient:
+        if self.http2:
+            try:
+                return httpx.AsyncClient(
+                    http2=True,
+                    limits=self._limits(),
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                )
+            except ImportError:
+                self.http2 = False
+        return httpx.AsyncClient(
+            limits=self._limits(),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+        )
+
+    def async_client_for(self, url: str) -> httpx.AsyncClient:
+        origin = _origin(url)
+        client = self._async_clients.get(origin)
+        if client is None:
+            client = self._create_async_client()
+            self._async_clients[origin] = client
+        return client
+
+    def _timeout(self, client: Any, timeout: float | None) -> Any:
+        read_timeout = self.read_timeout if timeout is None else timeout
+        if isinstance(client, (httpx.Client, httpx.AsyncClient)):
+            return httpx.Timeout(read_timeout, connect=min(self.connect_timeout, read_timeout))
+        return (min(self.connect_timeout, read_timeout), read_timeout)
+
+    def post(
+        self,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        json: Any = None,
+        timeout: float | None = None,
+    ) -> Any:
+        client = self.client_for(url)
+        host = urlsplit(url).netloc
+        try:
+            response = client.post(url, headers=headers, json=json, timeout=self._timeout(client, timeout))
+        except Exception:
+            upstream_responses.inc(host, "error")
+            raise
+        upstream_responses.inc(host, str(response.status_code))
+        return response
+
+    async def apost(
+        self,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        json: Any = None,
+        timeout: float | None = None,
+    ) -> httpx.Response:
+        client = self.async_client_for(url)
+        host = urlsplit(url).netloc
+        try:
+            response = await client.post(url, headers=headers, json=json, timeout=self._timeout(client, timeout))
+        except Exception:
+            upstream_responses.inc(host, "error")
+            raise
+        upstream_responses.inc(host, str(response.status_code))
+        return response
+
+    @asynccontextmanager
+    async def astream(
+        self,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        json: Any = None,
+        timeout: float | None = None,
+    ) -> AsyncIterator[httpx.Response]:
+        """POST and yield the response before its body is read; ``timeout`` applies per read."""
+        client = self.async_client_for(url)
+        host = urlsplit(url).netloc
+        opened = False
+        try:
+            async with client.stream(
+                "POST", url, headers=headers, json=json, timeout=self._timeout(client, timeout)
+            ) as response:
+                opened = True
+                upstream_responses.inc(host, str(response.status_code))
+                yield response
+        except Exception:
+            if not opened:
+                upstream_responses.inc(host, "error")
+            raise
+
+    def warm_up(self, urls: list[str], connections: int = HTTP_WARM_CONNECTIONS) -> dict[str, bool]:
+        """Open ``connections`` keep-alive connections to each upstream origin."""
+        origins = list(dict.fromkeys(_origin(url) for url in urls))
+        if not origins or connections <= 0:
+            return {}
+
+        def _probe(origin: str) -> bool:
+            client = self.client_for(origin)
+            try:
+                client.head(origin + "/", timeout=self._timeout(client, self.connect_timeout))
+                return True
+            except Exception:
+                return False
+
+        targets = [origin for origin in origins for _ in range(connections)]
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            outcomes = list(executor.map(_probe, targets))
+
+        warmed: dict[str, bool] = {}
+        for origin, ok in zip(targets, outcomes):
+            warmed[origin] = warmed.get(origin, False) or ok
+        return warmed
+
+    async def awarm_up(self, urls: list[str], connections: int = HTTP_WARM_CONNECTIONS) -> dict[str, bool]:
+        """Async counterpart of ``warm_up`` for the clients used by the API."""
+        origins = list(dict.fromkeys(_origin(url) for url in urls))
+        if not origins or connections <= 0:
+            return {}
+
+        async def _probe(origin: str) -> bool:
+            client = self.async_client_for(origin)
+            try:
+                await client.head(origin + "/", timeout=self._timeout(client, self.connect_timeout))
+                return True
+            except Exception:
+                return False
+
+        targets = [origin for origin in origins for _ in range(connections)]
+        outcomes = await asyncio.gather(*(_probe(origin) for origin in targets))
+
+        warmed: dict[str, bool] = {}
+        for origin, ok in zip(targets, outcomes):
+            warmed[origin] = warmed.get(origin, False) or ok
+        return warmed
+
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    async def aclose(self) -> None:
+        clients = list(self._async_clients.values())
+        self._async_clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+_upstream: UpstreamHTTP | None = None
+_upstream_lock = threading.Lock()
+
+
+def get_upstream_http() -> UpstreamHTTP:
+    global _upstream
+    upstream = _upstream
+    if upstream is None:
+        with _upstream_lock:
+            if _upstream is None:
+                _upstream = UpstreamHTTP()
+            upstream = _upstream
+    return upstream
+
@@ -5,7 +5,7 @@ Validates retrieve_sections() with 20 deterministic test cases.
 All expected section_numbers are verified to exist in ipc_enriched_v1.json.
 """
 
-from retrieve_sections import retrieve_sections
+from retrieve_sections import retrieve_sections_batch
 
 
 TEST_CASES = [
@@ -131,11 +131,10 @@ def run_test_cases() -> tuple[int, int]:
     passed = 0
     failed = 0
 
-    for i, test in enumerate(TEST_CASES, start=1):
-        description = test["description"]
+    batch_results = retrieve_sections_batch([test["description"] for test in TEST_CASES])
+    for i, (test, results) in enumerate(zip(TEST_CASES, batch_results), start=1):
         expected = test["expected_section"]
 
-        results = retrieve_sections(description)
         returned_sections = [r["section_number"] for r in results]
 
         if expected in returned_sections:
@@ -152,17 +151,19 @@ def run_edge_case_tests() -> tuple[int, int]:
     passed = 0
     failed = 0
 
-    for i, case in enumerate(EDGE_CASES, start=1):
-        try:
-            results = retrieve_sections(case)
-            if len(results) == 7:
-                print(f"[PASS] Edge case {i}: Returned 7 results, no crash")
-                passed += 1
-            else:
-                print(f"[FAIL] Edge case {i}: Expected 5 results, got {len(results)}")
-                failed += 1
-        except Exception as e:
+    try:
+        batch_results = retrieve_sections_batch(EDGE_CASES)
+    except Exception as e:
+        for i in range(1, len(EDGE_CASES) + 1):
             print(f"[FAIL] Edge case {i}: Crashed with {type(e).__name__}: {e}")
+        return 0, len(EDGE_CASES)
+
+    for i, results in enumerate(batch_results, start=1):
+        if len(results) == 7:
+            print(f"[PASS] Edge case {i}: Returned 7 results, no crash")
+            passed += 1
+        else:
+            print(f"[FAIL] Edge case {i}: Expected 5 results, got {len(results)}")
             failed += 1
 
     return passed, failed
@@ -0,0 +1,69 @@
+"""
+Vector Backend Parity Suite
+
+Runs every validate_retrieval query through both the Chroma backend and the
+in-memory NumPy backend and checks that they return the same ranked sections
+with matching similarities. Export the NumPy index first with
+`python vector_index.py`.
+"""
+
+from retrieve_sections import RetrievalEngine
+from validate_retrieval import EDGE_CASES, TEST_CASES
+
+
+SIMILARITY_TOLERANCE = 1e-4
+
+
+def compare_backends(chroma_engine: RetrievalEngine, numpy_engine: RetrievalEngine) -> tuple[int, int]:
+    passed = 0
+    failed = 0
+
+    queries = [test["description"] for test in TEST_CASES] + EDGE_CASES
+    for i, query in enumerate(queries, start=1):
+        chroma_rows = chroma_engine.retrieve_with_scores(query)
+        numpy_rows = numpy_engine.retrieve_with_scores(query)
+
+        chroma_sections = [row[0]["section_number"] for row in chroma_rows]
+        numpy_sections = [row[0]["section_number"] for row in numpy_rows]
+        max_delta = max(
+            (abs(a[1] - b[1]) for a, b in zip(chroma_rows, numpy_rows)),
+            default=0.0,
+        )
+        same_metadata = [row[0] for row in chroma_rows] == [row[0] for row in numpy_rows]
+
+        if chroma_sections == numpy_sections and same_metadata and max_delta <= SIMILARITY_TOLERANCE:
+            print(f"[PASS] Query {i:02d}: {numpy_sections} (max similarity delta {max_delta:.2e})")
+            passed += 1
+        else:
+            print(f"[FAIL] Query {i:02d}: chroma={chroma_sections} numpy={numpy_sections} (max delta {max_delta:.2e})")
+            failed += 1
+
+    return passed, failed
+
+
+def main() -> None:
+    print("=" * 60)
+    print("VECTOR BACKEND PARITY SUITE")
+    print("=" * 60)
+
+    chroma_engine = RetrievalEngine(backend="chroma")
+    numpy_engine = RetrievalEngine(backend="numpy")
+    chroma_engine.open()
+    numpy_engine.open()
+
+    try:
+        passed, failed = compare_backends(chroma_engine, numpy_engine)
+    finally:
+        chroma_engine.close()
+        numpy_engine.close()
+
+    print()
+    print(f"Queries matching: {passed} / {passed + failed}")
+    if failed > 0:
+        raise AssertionError(f"Backend parity failed for {failed} quer{'y' if failed == 1 else 'ies'}.")
+
+    print("Chroma and NumPy backends agree.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+
+NUMPY_INDEX_PATH = Path(__file__).resolve().parent / "numpy_ipc_v1.npy"
+
+
+def _metadata_path(matrix_path: Path) -> Path:
+    return matrix_path.with_suffix(".meta.json")
+
+
+def distance_to_similarity(distance: float, space: str) -> float:
+    """Convert a backend distance to cosine similarity for unit-length embeddings.
+
+    Chroma's ``l2`` space reports squared Euclidean distance, which for unit
+    vectors is ``2 - 2 * cos``; ``cosine`` and ``ip`` report ``1 - cos``.
+    """
+    if space == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+
+class VectorIndex:
+    """Minimal vector-store interface used by the retrieval engine.
+
+    ``query`` returns ``(ids, distances)`` ordered by ascending distance, with
+    distances in the same space Chroma reports for the collection. Section
+    content is resolved from the SectionCatalog, not from the store.
+    """
+
+    space = "l2"
+    # Whether a query may block long enough that async callers should offload it.
+    blocking = True
+
+    def query(self, query_embedding: list[float], n_results: int) -> tuple[list[str], list[float]]:
+        raise NotImplementedError
+
+    def query_batch(
+        self,
+        query_embeddings: list[list[float]],
+        n_results: int,
+    ) -> list[tuple[list[str], list[float]]]:
+        return [self.query(embedding, n_results) for embedding in query_embeddings]
+
+    def ids(self) -> list[str]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class ChromaVectorIndex(VectorIndex):
+    def __init__(self, collection: Any) -> None:
+        self._collection = collection
+        configuration = getattr(collection, "configuration", None) or {}
+        hnsw = configuration.get("hnsw") or {}
+        metadata = collection.metadata or {}
+        self.space = str(hnsw.get("space") or metadata.get("hnsw:space") or "l2")
+
+    def query(self, query_embedding: list[float], n_results: int) -> tuple[list[str], list[float]]:
+        return self.query_batch([query_embedding], n_results)[0]
+
+    def query_batch(
+        self,
+        query_embeddings: list[list[float]],
+        n_results: int,
+    ) -> list[tuple[list[str], list[float]]]:
+        if not query_embeddings:
+            return []
+        query_result = self._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=["distances"],
+        )
+        return list(zip(query_result["ids"], query_result["distances"]))
+
+    def ids(self) -> list[str]:
+        return list(self._collection.get(include=[])["ids"])
+
+    def count(self) -> int:
+        return self._collection.count()
+
+
+class NumpyVectorIndex(VectorIndex):
+    """Exact search over a preloaded float32 matrix.
+
+    The corpus is small enough (522 sections) that a full matrix-vector product
+    plus ``argpartition`` is cheaper than an HNSW lookup through Chroma.
+    """
+
+    blocking = False
+
+    def __init__(self, matrix: np.ndarray, ids: list[str], space: str) -> None:
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError("Index matrix and ids must have matching lengths")
+        self.space = space
+        self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._ids = [str(section_id) for section_id in ids]
+        self._squared_norms = np.einsum("ij,ij->i", self._matrix, self._matrix)
+        self._norms = np.sqrt(self._squared_norms)
+
+    @classmethod
+    def load(cls, matrix_path: str | Path = NUMPY_INDEX_PATH) -> "NumpyVectorIndex":
+        matrix_path = Path(matrix_path)
+        with _metadata_path(matrix_path).open("r", encoding="utf-8") as file:
+            meta = json.load(file)
+        matrix = np.load(matrix_path)
+        return cls(matrix, meta["ids"], meta.get("space", "l2"))
+
+    def _distances(self, query_embeddings: np.ndarray) -> np.ndarray:
+        dots = query_embeddings @ self._matrix.T
+        if self.space == "cosine":
+            query_norms = np.linalg.norm(query_embeddings, axis=1)
+            denominator = np.outer(query_norms, self._norms)
+            denominator[denominator == 0.0] = 1.0
+            return 1.0 - dots / denominator
+        if self.space == "ip":
+            return 1.0 - dots
+        query_squared_norms = np.einsum("ij,ij->i", query_embeddings, query_embeddings)
+        return np.maximum(
+            self._squared_norms[np.newaxis, :] + query_squared_norms[:, np.newaxis] - 2.0 * dots,
+            0.0,
+        )
+
+    def _top_k(self, distances: np.ndarray, n_results: int) -> tuple[list[str], list[float]]:
+        total = distances.shape[0]
+        n_results = min(n_results, total)
+        if n_results <= 0:
+            return [], []
+
+        if n_results < total:
+            candidates = np.argpartition(distances, n_results - 1)[:n_results]
+            # Keep every row tied with the cut-off so the caller's tie-break decides.
+            cutoff = distances[candidates].max()
+            candidates = np.flatnonzero(distances <= cutoff)
+        else:
+            candidates = np.arange(total)
+
+        ordered = candidates[np.argsort(distances[candidates], kind="stable")]
+        return (
+            [self._ids[i] for i in ordered],
+            [float(distances[i]) for i in ordered],
+        )
+
+    def query(self, query_embedding: list[float], n_results: int) -> tuple[list[str], list[float]]:
+        return self.query_batch([query_embedding], n_results)[0]
+
+    def query_batch(
+        self,
+        query_embeddings: list[list[float]],
+        n_results: int,
+    ) -> list[tuple[list[str], list[float]]]:
+        if not query_embeddings:
+            return []
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        distances = self._distances(queries)
+        return [self._top_k(row, n_results) for row in distances]
+
+    def ids(self) -> list[str]:
+        return list(self._ids)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+
+def export_numpy_index(collection: Any, matrix_path: str | Path = NUMPY_INDEX_PATH) -> Path:
+    rows = collection.get(include=["embeddings"])
+    matrix = np.asarray(rows["embeddings"], dtype=np.float32)
+    space = ChromaVectorIndex(collection).space
+
+    matrix_path = Path(matrix_path)
+    matrix_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(matrix_path, matrix)
+    with _metadata_path(matrix_path).open("w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "collection": collection.name,
+                "space": space,
+                "ids": list(rows["ids"]),
+            },
+            file,
+            ensure_ascii=False,
+        )
+    return matrix_path
+
+
+def main() -> None:
+    import chromadb
+
+    try:
+        from script.retrieve_sections import COLLECTION_NAME, _resolve_persist_directory
+    except ImportError:
+        from retrieve_sections import COLLECTION_NAME, _resolve_persist_directory
+
+    client = chromadb.PersistentClient(path=_resolve_persist_directory())
+    collection = client.get_collection(name=COLLECTION_NAME)
+    path = export_numpy_index(collection)
+    print(f"Exported {collection.count()} vectors to {path}")
+    print(f"Metadata written to {_metadata_path(path)}")
+
+
+if __name__ == "__main__":
+    main()